@@ -5,14 +5,16 @@ Base class for agents.
 import sys
 import decimal
 from abc import abstractmethod
-from copy import deepcopy
 from decimal import Decimal
 from enum import Enum
 
 import multiprocessing as mp
 import multiprocessing.connection as mpc
+from multiprocessing.reduction import ForkingPickler
+import queue
+import threading
 
-from agent.shmem import ShMemOHLCV
+from agent.shmem import ShMemOHLCV, ShMemNotifier
 import asyncio
 
 import numpy as np
@@ -67,7 +69,6 @@ class AccountItemType(Enum):
     FUNDING = 5
 
 class QMsgType(Enum):
-    QMSG_OHLCV = 1
     QMSG_TX = 2
 
 class OHLCV:
@@ -209,6 +210,11 @@ class AssetAnalyzerBase:
     @abstractmethod
     def warmup(self, data: np.ndarray): ...
 
+    # initialize with a block of warmup data rows [bars, columns], override for a vectorized warmup.
+    def warmup_batch(self, data: np.ndarray):
+        for row in data:
+            self.warmup(row)
+
     @abstractmethod
     def __call__(self, ohlcv: np.ndarray) -> TxRq | None: ...
 
@@ -232,7 +238,7 @@ class StrategyBase:
     def __call__(self, timeframe: int, signal: int | None, price: float) -> TxRqOp | None: ...
 
     def _debug_print_positions(self, tx: Tx | None = None):
-        print(f"positions {"before" if tx else "after"} tx")
+        print(f"positions {'before' if tx else 'after'} tx")
         for _pos in self.positions:
             print(f"\tprice {_pos.open_price} | pnl {_pos.realized_pnl} | value {_pos.value} | base value {_pos.value_base}")
         if tx:
@@ -275,6 +281,7 @@ class StrategyBase:
 
 
 class AgentBase:
+    ACK_WINDOW = 64  # messages sent to the agent process ahead of their acknowledgements
     shmem: ShMemOHLCV = None
     proc: mp.Process
 
@@ -299,7 +306,14 @@ class AgentBase:
         # compose merged data plan
         self.data_plan = AssetDataPlan(self.common_params.provider, self.common_params.market, [(ap.asset, ap.timeframe) for ap in self.analyzers_params])
 
-        self.pipe_cli = self.pipe_srv = self.lock = None
+        self.pipe_cli = self.pipe_srv = None
+        self.ack_window: asyncio.Semaphore | None = None
+        self.acks_drained: asyncio.Event | None = None
+        self.acks_pending = 0
+        self.send_queue = queue.SimpleQueue()  # (message, loop, future) to write to the pipe, None stops the writer
+        self.writer: threading.Thread | None = None
+        self.pipe_closed = False
+        self.notifier: ShMemNotifier | None = None
 
     def __del__(self):
         if self.shmem is not None:
@@ -335,6 +349,7 @@ class AgentBase:
 
     def start(self, tx_queue: mp.Queue) -> None:
         self.pipe_cli, self.pipe_srv = mp.Pipe()
+        self.notifier = ShMemNotifier()  # inherited by the forked agent process
         strategy_cls = self.get_strategy_cls()  #todo: get type directly, or use the base class
         self.proc = mp.Process(target=self.operate, args=(strategy_cls, self.strategy_params, len(self.analyzers_params), tx_queue, self.pipe_srv))
         self.proc.start()
@@ -343,9 +358,10 @@ class AgentBase:
         assert self.proc is not None, "Agent has not been started."
         if self.proc.is_alive():
             try:
-                # graceful shutdown signal (None sentinel)
-                for i in range(4):
-                    self.pipe_cli.send(None)
+                # graceful shutdown signal (None sentinel) after the queued messages
+                if self._stop_writer():
+                    for i in range(4):
+                        self.pipe_cli.send(None)
                 # wait for process to exit
 
                 self.proc.join(timeout=1.0)
@@ -356,31 +372,116 @@ class AgentBase:
                 self.log.info("🗙 the agent has not been normally shut down and was terminated")
             finally:
                 self.pipe_cli.close()
+                self.notifier.close()
                 self.log.info("🗙 the agent was shut down")
 
     # to call at the beginning of each async loop if it calls push_data
     async def init_data_feed(self):
-        self.lock = asyncio.Lock()
+        self.ack_window = asyncio.Semaphore(self.ACK_WINDOW)
+        self.acks_drained = asyncio.Event()
+        self.acks_drained.set()
+        self.acks_pending = 0
+        if self.writer is None:
+            self.writer = threading.Thread(target=self._write, name=f"{self.name} pipe writer", daemon=True)
+            self.writer.start()
+        # acknowledgements are read by the loop when the pipe is readable, without threads and polling
+        asyncio.get_running_loop().add_reader(self.pipe_cli.fileno(), self._recv_acks)
+
+    def _recv_acks(self):
+        try:
+            while self.pipe_cli.poll():
+                if self.pipe_cli.recv() == "ACK":
+                    self.acks_pending -= 1
+                    self.ack_window.release()
+                    if self.acks_pending == 0:
+                        self.acks_drained.set()
+        except (EOFError, OSError):
+            self._pipe_lost()
+
+    def _pipe_lost(self):
+        """
+        the agent process is gone: wake up the senders waiting for the window and flush_data, they raise EOFError
+        """
+        if not self.pipe_closed:
+            self.log.error("the agent process has closed the pipe")
+        self.pipe_closed = True
+        asyncio.get_running_loop().remove_reader(self.pipe_cli.fileno())
+        self.acks_pending = 0
+        self.ack_window.release()  # every woken sender passes the wakeup on to the next one
+        self.acks_drained.set()
+
+    def _write(self):
+        """
+        the only writer of the pipe, a thread: the messages are written whole and in order, and a write blocked
+        on the full pipe (the ACK window of big messages exceeds the socket buffer) never stalls the event loop
+        """
+        while (item := self.send_queue.get()) is not None:
+            buf, loop, fut = item
+            try:
+                self.pipe_cli.send_bytes(buf)
+                error = None
+            except OSError as e:
+                error = e
+            try:
+                loop.call_soon_threadsafe(AgentBase._sent, fut, error)
+            except RuntimeError:
+                pass  # the loop of the sender is closed
+
+    @staticmethod
+    def _sent(fut: asyncio.Future, error: OSError | None):
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(None)
+
+    def _stop_writer(self) -> bool:
+        """
+        stops the writer after the queued messages, returns False if it is stuck on the pipe the agent does not read
+        """
+        if self.writer is not None:
+            self.send_queue.put(None)
+            self.writer.join(timeout=1.0)
+            if self.writer.is_alive():
+                return False
+            self.writer = None
+        return True
+
+    async def _send(self, data):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.send_queue.put((ForkingPickler.dumps(data), loop, fut))  # the same format as Connection.send
+        try:
+            await asyncio.shield(fut)  # a cancelled sender does not withdraw the message, the writer completes it
+        except OSError:
+            self._pipe_lost()
+            raise
 
-    # call init_data_feed in the same async loop before the first use
+    # call init_data_feed in the same async loop before the first use.
+    # Sending is pipelined: up to ACK_WINDOW messages are in flight, the agent processes them in order.
     async def push_data(self, data, wait_ack = True):
-        async with self.lock:
-            # send data for warmup
-            await asyncio.to_thread(self.pipe_cli.send, data)
-            if data is None or not wait_ack:
-                return  # do not wait acknowledgement after final sending of None
-            # non-blocking read of acknowledgment
-            while True:
-                if await asyncio.to_thread(lambda: mpc.wait([self.pipe_cli], timeout=1)):
-                    try:
-                        ack = await asyncio.to_thread(self.pipe_cli.recv)
-                        if ack == "ACK":
-                            break
-                        # else:
-                        #     self.log.error("Failed ACK.")
-                    except EOFError:
-                        pass  # no answer yet
-                await asyncio.sleep(0.001)  # small delay to avoid busy-waiting
+        if self.pipe_closed:
+            raise EOFError("the agent process has closed the pipe")
+        if data is None or not wait_ack:
+            await self._send(data)  # no acknowledgement for the final None and notices
+            return
+        await self.ack_window.acquire()
+        if self.pipe_closed:
+            self.ack_window.release()
+            raise EOFError("the agent process has closed the pipe")
+        self.acks_pending += 1
+        self.acks_drained.clear()
+        await self._send(data)
+
+    # waits until the agent has acknowledged all the sent data, to call before leaving the async loop
+    async def flush_data(self):
+        await self.acks_drained.wait()
+        asyncio.get_running_loop().remove_reader(self.pipe_cli.fileno())
+        if self.pipe_closed:
+            raise EOFError("the agent process has closed the pipe before acknowledging all the data")
+
+    # wakes the agent process up on new closed candles in the shared memory, non-blocking, callable from the event loop
+    def notify_data(self):
+        self.notifier.notify()
 
     def operate(self, strategy_cls: type, strategy_params: dict, n_analyzers: int, tx_queue: mp.Queue, pipe: mp.Pipe):
         # create analyzers
@@ -428,6 +529,8 @@ class AgentBase:
                 except EOFError:
                     break  # sender had closed the connection
             self.log.info("account data update finished")
+            shmem = ShMemOHLCV(self.agent_id)
+            assert shmem.depth > 1, f"Shared memory {shmem.name} has no history of closed candles"
             # receive warmup data
             feed_cout = len(analyzers)
             while True:
@@ -439,31 +542,50 @@ class AgentBase:
                             break
                         continue
                     tf, data = data
-                    analyzers[tf].warmup(data)
+                    if isinstance(data, int):  # count of the last closed candles of the stream in the shared memory
+                        analyzer = analyzers[tf]
+                        bars, _ = shmem.since(tf, analyzer.asset_id, shmem.cursor(tf, analyzer.asset_id) - data)
+                        block = np.zeros((len(bars), 7))  # rows [ts, ohlcv, turnover], the analyzers use ohlcv only
+                        block[:, 1:-1] = bars
+                        analyzer.warmup_batch(block)
+                    elif data.ndim == 2:  # a block of the whole history
+                        analyzers[tf].warmup_batch(data)
+                    else:
+                        analyzers[tf].warmup(data)
                     pipe.send("ACK")
                 except EOFError:
                     break  # sender had closed the connection
             self.log.info("🗘 warmup finished, ready for trading")
             # get to the main work
-            shmem = ShMemOHLCV(self.agent_id)
+            # the feed advances the stream cursors and rings the notifier, the streams with new cursors are processed
+            cursors = {tf: shmem.cursor(tf, a.asset_id) for tf, a in analyzers.items()}
             while True:
                 try:
-                    data = pipe.recv()  # blocking receiving from the pipe
-                    if data is None:  # end of data
-                        break
-                    msg_type, data = data
-                    if msg_type == QMsgType.QMSG_OHLCV:  # read new market data from the shmem and process it
-                        tf = int(data)
-                        if tf in analyzers.keys():
-                            ohlcv = deepcopy(shmem.read(tf, analyzers[tf].asset_id))
-                            shmem.clear(tf, analyzers[tf].asset_id)  # clean used cell for proper accumulation of next values
-                            signal = analyzers[tf](ohlcv)
+                    ready = mpc.wait([pipe, self.notifier])  # blocking wait for new market data or messages
+                    if self.notifier in ready:  # read new market data from the shmem and process it
+                        self.notifier.clear()
+                        for tf, analyzer in analyzers.items():
+                            if shmem.cursor(tf, analyzer.asset_id) == cursors[tf]:
+                                continue
+                            # the closed candles are read from the history: the latest slot may already hold the next candle
+                            bars, cursors[tf] = shmem.since(tf, analyzer.asset_id, cursors[tf])
+                            if len(bars) == 0:
+                                continue
+                            for ohlcv in bars[:-1]:  # catch up after a stall, the strategy gets the latest candle only
+                                analyzer(ohlcv)
+                            ohlcv = bars[-1]
+                            signal = analyzer(ohlcv)
                             tx_rq_op = strategy(tf, signal, float(ohlcv[3])) #todo: rm convertion
                             if tx_rq_op is not None:
                                 tx_rq = TxRq(self.common_params.provider, self.common_params.market, self.common_params.asset, tx_rq_op)
                                 tx_queue.put(tx_rq)
-                    elif msg_type == QMsgType.QMSG_TX:
-                        strategy.trade_update(data)
+                    if pipe in ready:
+                        data = pipe.recv()
+                        if data is None:  # end of data
+                            break
+                        msg_type, data = data
+                        if msg_type == QMsgType.QMSG_TX:
+                            strategy.trade_update(data)
                 except EOFError:
                     break  # sender had closed the connection
         except Exception as e:
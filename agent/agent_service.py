@@ -5,6 +5,7 @@ import logging
 import threading
 import multiprocessing as mp
 import asyncio
+from collections import OrderedDict
 
 import keyring
 import yaml
@@ -20,7 +21,8 @@ from proto.tgbot_pb2 import TGBotMsg, TxNotice, AgentError
 
 from connectors.enums import ConnMode, Provider, MarketType, TxStatus
 from connectors.objects import Asset, Tx
-from connectors.helpers import opposite_sign
+from connectors.helpers import gen_asset_id, opposite_sign
+from connectors.ohlcv_cache import OHLCVCache
 
 from agent.shmem import ShMemOHLCV
 from agent.money_guard import MoneyGuard
@@ -73,14 +75,19 @@ class AgentService:
         self.agent = agent
         self.data_plan = AgentService.ConsolidatedDataPlan()  # rearranged data plan of the agent
         self.market_queue = asyncio.Queue()  # for market data warmup input for the agent
+        self.shmem_depth = int(params.get("shmem_history_depth", 1000))  # closed candles kept per stream
+        assert self.shmem_depth >= 2, "shmem_history_depth must be at least 2: the agent reads the closed candles from the history"
         self.shmem = self.create_shmem()  # for agent market data input feed
         # objects for processing of agent output transactions
         self.tx_rq_queue = mp.Queue()
         self.tx_rpt_queue = asyncio.Queue()
 
-        self.conn_ts = self._import_connector_class("state", "TradingState")(self.api_key, self.api_secret, self.conn_mode)
+        ohlcv_cache_dir = params.get("ohlcv_cache_dir")  # local store of the closed candles for the warmup, not used if not set
+        self.conn_ts = self._import_connector_class("state", "TradingState")(self.api_key, self.api_secret, self.conn_mode,
+                                                                              cache=OHLCVCache(ohlcv_cache_dir) if ohlcv_cache_dir else None)
         self.conn_to = self._import_connector_class("operation", "TradingOperation")(self.api_key, self.api_secret, self.conn_mode)
         self.conn_fm = None
+        self.conn_fa = None
 
         # for tx reports
         self.base_ticker = None
@@ -89,12 +96,14 @@ class AgentService:
 
         self.tx_log = TxLog("./tx_log.sqlite")
         self.tx_log_last_ts = self.tx_log.get_last_record_ts()
+        self.tx_reconcile_period = float(params.get("tx_reconcile_period_s", 30.))  # REST polling period for the order updates missed by the WebSocket feed
+        self.tx_orders = OrderedDict()  # the last handled update (cumulative executed values) of the recent orders by order id
         self.money_guard = MoneyGuard(params, self.tx_log)
 
         # objects for services
         self.stop_event = asyncio.Event()
         self.service_tasks = []
-        self.market_q = asyncio.Queue()
+        self.market_qs = {aid: asyncio.Queue() for aid in self.data_plan.assets}  # per asset market data streams
         self.tx_result_q = asyncio.Queue()
 
         self.zmq_context = zmq.Context()
@@ -118,18 +127,17 @@ class AgentService:
             self.log.info("Shared memory is being created...")
             agent_data_plan = self.agent.get_data_plan()
             self.data_plan.add_plan(agent_data_plan)
-            new_size = []
+            keys = []
             for aid, asset in self.data_plan.assets.items():
                 for tf in self.data_plan.timeframes[aid]:
-                    v = (aid, tf)
-                    if v not in new_size:
-                        new_size.append(v)
-            new_size = len(new_size)
-            shmem = ShMemOHLCV(self.agent.agent_id, size=new_size)
-            if shmem.size < new_size:
-                self.log.info(f"Shared memory {shmem.name} of size {shmem.size} already exists, but needed size {new_size} is bigger. The shared memory will be recreated.")
+                    v = (tf, aid)
+                    if v not in keys:
+                        keys.append(v)
+            shmem = ShMemOHLCV(self.agent.agent_id, keys=keys, depth=self.shmem_depth)
+            if not shmem.has_keys(keys) or shmem.depth != self.shmem_depth:
+                self.log.info(f"Shared memory {shmem.name} of {shmem.size} slots and depth {shmem.depth} already exists, but {len(keys)} streams of depth {self.shmem_depth} are needed. The shared memory will be recreated.")
                 shmem.cleanup()
-                shmem = ShMemOHLCV(self.agent.agent_id, size=new_size)
+                shmem = ShMemOHLCV(self.agent.agent_id, keys=keys, depth=self.shmem_depth)
             self.log.info(f"🗹 Shared memory {shmem.name} has been created.")
             return shmem
         except Exception as e:
@@ -191,19 +199,18 @@ class AgentService:
                     log.info(f"🗙 finished")
 
             async def feed_hist_data(tf, period):
-                async def fetch_hist_data(provider_id: Provider, market_id: MarketType, asset: str, timeframe: int, period: int):
-                    try:
-                        return self.conn_ts.get_price_history(market_id, asset, timeframe, period)
-                    except Exception as e:
-                        log.error(e, exc_info=True)
-                    return None
-
                 log = mplog.get_logger(f"History market data feed for tf {tf}, period {period}")
                 log.info(f"🗘 starting...")
                 try:
-                    async for data_row in await fetch_hist_data(self.agent.common_params.provider, self.agent.common_params.market, self.agent.common_params.asset, tf, period):
-                        if data_row is not None:
-                            await self.agent.push_data((tf, data_row))
+                    block = await self.conn_ts.load_price_history(self.agent.common_params.market, self.agent.common_params.asset, tf, period)
+                    closed = block[block[:, 0] + tf * 60000 <= time.time() * 1000]  # the live feed closes the last candle later
+                    if 0 < len(closed) < self.shmem.depth:
+                        # the history goes to the ring of the stream, the agent warms up from the shared memory (since)
+                        aid = gen_asset_id(self.agent.common_params.provider, self.agent.common_params.market, self.agent.common_params.asset)
+                        self.shmem.extend(tf, aid, closed[:, 1:-1])
+                        await self.agent.push_data((tf, len(closed)))
+                    elif len(block):  # the ring can not hold the history, it is sent as a single block of rows [ts, ohlcv, turnover]
+                        await self.agent.push_data((tf, block))
                 except Exception as e:
                     log.error(e, exc_info=True)
                 finally:
@@ -219,6 +226,8 @@ class AgentService:
             wa_periods = self.agent.get_warmup_periods()
             tasks = [asyncio.create_task(feed_hist_data(tf, period)) for tf, period in wa_periods]
             await asyncio.gather(*tasks)  # wait for the completion of all tasks (sending all data)
+            await self.agent.flush_data()  # wait for the agent to process all data
+            await self.conn_ts.close()  # the connection pool belongs to this event loop
 
         try:
             asyncio.run(start_agent_impl())
@@ -226,17 +235,16 @@ class AgentService:
         except Exception as e:
             self.log.error(e, exc_info=True)
 
-    async def market_data_feed(self, q: asyncio.Queue):
+    # the minimal timeframe of every asset is streamed into the queue of the asset, the higher ones are aggregated from it
+    async def market_data_feed(self, qs: dict[int, asyncio.Queue]):
         log = mplog.get_logger("Market data feed")
         try:
             log.info("🗘 starting...")
-            self.conn_fm = self._import_connector_class("feeding", "FeedingMarket")(self.agent.common_params.market, q, self.conn_mode)
-
-            assets = self.data_plan.assets.items()  # todo: traverse along all assets
-            asset = list(assets)[0]
-            tf = self.data_plan.min_timeframes[asset[0]]
-            self.conn_fm.start_feed(asset[1], tf)
-            log.info("🗘 started")
+            self.conn_fm = self._import_connector_class("feeding", "FeedingMarket")(self.agent.common_params.market, None, self.conn_mode)
+            for aid, ticker in self.data_plan.assets.items():
+                self.conn_fm.subscribe(ticker, self.data_plan.min_timeframes[aid], qs[aid])
+            self.conn_fm.start()
+            log.info(f"🗘 started for {len(qs)} assets")
         except Exception as e:
             self.log.error(e, exc_info=True)
 
@@ -252,10 +260,13 @@ class AgentService:
         ohlcv_h[3] = ohlcv_l[3]  # close
         ohlcv_h[4] += ohlcv_l[4]  # volume
 
-    # market data handler
-    async def market_data_handler(self, q: asyncio.Queue):
-        log = mplog.get_logger("Market data handler")
+    # market data handler of an asset
+    async def market_data_handler(self, q: asyncio.Queue, aid: int):
+        log = mplog.get_logger(f"Market data handler for {self.data_plan.assets[aid]}")
         log.info("🗘 starting...")
+        timeframes = self.data_plan.timeframes[aid]
+        min_timeframe = self.data_plan.min_timeframes[aid]
+        closed = set()  # timeframes of finished candles, the next update starts a new candle
         try:
             while True:
                 # retrieve data
@@ -263,16 +274,21 @@ class AgentService:
                 ohlcv = [float(data["open"]), float(data["high"]), float(data["low"]), float(data["close"]), float(data["volume"])]
                 ts_min = int(data["timestamp"]) // 60000  # ms -> mins
                 # update shmem buffer for strategy
-                for aid, timeframes in self.data_plan.timeframes.items():
-                    for tf in timeframes:
-                        if tf == self.data_plan.min_timeframes[aid]:
-                            self.shmem.store(tf, aid, np.array(ohlcv))
-                        else:
-                            ohlcv_tf = self.shmem.read(tf, aid)
-                            AgentService.update_ohlcv(ohlcv_tf, ohlcv)
-                            self.shmem.store(tf, aid, ohlcv_tf)
-                        if ts_min % tf == 0:  # notify agent when the candle finished
-                            await self.agent.push_data((QMsgType.QMSG_OHLCV, tf), wait_ack=False)
+                notify = False
+                for tf in timeframes:
+                    if tf == min_timeframe:
+                        ohlcv_tf = np.array(ohlcv)
+                    else:
+                        ohlcv_tf = np.zeros(5) if tf in closed else self.shmem.read(tf, aid)
+                        closed.discard(tf)
+                        AgentService.update_ohlcv(ohlcv_tf, ohlcv)
+                    self.shmem.store(tf, aid, ohlcv_tf)
+                    if ts_min % tf == 0:  # the candle finished: advance the stream cursor
+                        closed.add(tf)
+                        self.shmem.append(tf, aid, ohlcv_tf)
+                        notify = True
+                if notify:  # a single wakeup of the agent for all finished candles
+                    self.agent.notify_data()
         except asyncio.CancelledError:
             pass
         except Exception as e:
@@ -334,6 +350,20 @@ class AgentService:
             # todo: handle full buffer: log, drop, save to disk
             self.log.warning("Tx notice message not delivered to TG-bot")
 
+    # the main source of the order updates: pushed by the private WebSocket streams of the orders and the executions,
+    # both report the cumulative states of the orders (the first one to arrive is accounted, see tx_rpt_handler)
+    async def tx_rpt_feed(self, tx_result_queue: asyncio.Queue):
+        log = mplog.get_logger("Tx report feed")
+        try:
+            log.info("🗘 starting...")
+            self.conn_fa = self._import_connector_class("feeding_acc", "FeedingAccount")(tx_result_queue, self.api_key, self.api_secret, self.conn_mode)
+            self.conn_fa.start_feed_ord()
+            self.conn_fa.start_feed_tx()
+            log.info("🗘 started")
+        except Exception as e:
+            log.error(e, exc_info=True)
+
+    # reconciler: fetches the order updates missed by the feed (e.g. while it reconnects)
     async def tx_rpt_poller(self, market: MarketType, ticker: str, tx_result_queue: asyncio.Queue):
         log = mplog.get_logger("Tx report poller")
         log.info("🗘 starting...")
@@ -343,7 +373,7 @@ class AgentService:
                     self.tx_log_last_ts = await self.conn_to.fetch_orders_result(market, ticker, self.tx_log_last_ts, tx_result_queue)
                 except Exception as e:
                     log.error(e)
-                await asyncio.sleep(1.0)
+                await asyncio.sleep(self.tx_reconcile_period)
         except asyncio.CancelledError:
             pass
         except Exception as e:
@@ -353,17 +383,41 @@ class AgentService:
 
     # reads posted orders from the queue, fetches the execution results and handles them
     async def tx_rpt_handler(self, tx_result_queue: asyncio.Queue):
+        # the order updates carry the cumulative executed values (each partial fill repeats the previous ones),
+        # returns the update with the values executed since the last handled update of the order,
+        # None for a stale or already handled update (the feed and the polling deliver the same ones)
+        def increment(tx: Tx) -> Tx | None:
+            last = self.tx_orders.get(tx.order_id)
+            if last is None:
+                value, value_base, fee = tx.value, tx.value_base, tx.fee
+            else:
+                if abs(tx.value) < abs(last.value) or (tx.value == last.value and tx.status == last.status):
+                    return None
+                value, value_base, fee = tx.value - last.value, tx.value_base - last.value_base, tx.fee - last.fee
+            self.tx_orders[tx.order_id] = tx
+            self.tx_orders.move_to_end(tx.order_id)
+            if len(self.tx_orders) > 1000:
+                self.tx_orders.popitem(last=False)
+            price = value_base / value if value else tx.price  # the average price of the increment
+            return Tx(tx.order_id, tx.market, tx.ticker, tx.op_side, tx.op_type, value, value_base, price, fee, tx.ts_ms, tx.status, tx.reason)
+
         async def handler(tx: Tx):
             if tx:
-                if tx.price and tx.value != 0:
-                    if tx.status == TxStatus.REJECTED:
+                if tx.market != self.agent.common_params.market or tx.ticker != self.agent.common_params.asset:
+                    return  # the account feed carries the orders of all assets
+                order = tx
+                tx = increment(order)
+                if tx is None:
+                    return
+                if order.price and order.value != 0:
+                    if order.status == TxStatus.REJECTED:
                         #todo: tell to the strategy?
-                        await self._tg_notify_on_tx(tx, Decimal(0), f"tx rejected ({tx.reason})")
+                        await self._tg_notify_on_tx(order, Decimal(0), f"tx rejected ({order.reason})")
                         return
-                    elif tx.status == TxStatus.CANCELLED:
-                        await self._tg_notify_on_tx(tx, Decimal(0), f"tx cancelled ({tx.reason})")
+                    elif order.status == TxStatus.CANCELLED:
+                        await self._tg_notify_on_tx(order, Decimal(0), f"tx cancelled ({order.reason})")
                         return
-
+                if tx.price and tx.value != 0:  # the values executed since the previous update of the order
                     await self.agent.push_data((QMsgType.QMSG_TX, tx), wait_ack=False)
 
                     pnl = -tx.fee
@@ -404,12 +458,19 @@ class AgentService:
                     if not trade_allowed:
                         await self._tg_notify_on_trade_disallowance()
 
+        async def handle_burst(txs: list[Tx]):
+            for tx in txs:
+                await handler(tx)
+
         log = mplog.get_logger("Tx report handler")
         log.info("🗘 starting...")
         try:
             while True:
-                tx = await tx_result_queue.get()
-                asyncio.create_task(handler(tx))
+                txs = await tx_result_queue.get()
+                if isinstance(txs, list):  # a burst of updates from the account feed is handled in order in one task
+                    asyncio.create_task(handle_burst(txs))
+                else:
+                    asyncio.create_task(handler(txs))
         except asyncio.CancelledError:
             pass
         except Exception as e:
@@ -420,12 +481,15 @@ class AgentService:
     def start_services(self):
         async def start_services_impl():
             await self.agent.init_data_feed()
-            self.service_tasks = [asyncio.create_task(self.market_data_handler(self.market_q)), asyncio.create_task(self.market_data_feed(self.market_q)),
-                asyncio.create_task(self.tx_rpt_handler(self.tx_rpt_queue)),
+            self.service_tasks = [asyncio.create_task(self.market_data_handler(q, aid)) for aid, q in self.market_qs.items()]
+            self.service_tasks += [asyncio.create_task(self.market_data_feed(self.market_qs)),
+                asyncio.create_task(self.tx_rpt_handler(self.tx_rpt_queue)), asyncio.create_task(self.tx_rpt_feed(self.tx_rpt_queue)),
                 asyncio.create_task(self.tx_rpt_poller(self.agent.common_params.market, self.agent.common_params.asset, self.tx_rpt_queue)),
                 asyncio.create_task(self.tx_rq_poller(self.tx_rq_queue))
             ]
             await self.stop_event.wait()
+            await self.conn_to.close()
+            await self.conn_ts.close()
 
         try:
             self.log.info("starting agent services...")
@@ -461,6 +525,9 @@ class AgentService:
             if self.conn_fm:
                 self.conn_fm.cleanup()
                 self.log.info("🗙 Market data feeder was shut down.")
+            if self.conn_fa:
+                self.conn_fa.cleanup()
+                self.log.info("🗙 Tx report feeder was shut down.")
             for task in self.service_tasks:
                 task.cancel()
             self.stop_event.set()
@@ -28,6 +28,12 @@ class Analyzer(ab.AssetAnalyzerBase):
     def warmup(self, data: np.ndarray):
         self.input_frame.warmup(data, self.params.fractal_period)
 
+    def warmup_batch(self, data: np.ndarray):
+        if self.input_frame.wu_pt == 0:  # nothing is accumulated yet, build the frame from the whole block
+            self.input_frame = InputFrame.from_history(self.params, self.params.fractal_period, data[:, 1:-1])
+        else:
+            super().warmup_batch(data)
+
     @abstractmethod
     def __call__(self, ohlcv: np.ndarray) -> int | None:
         self.input_frame(ohlcv)
@@ -9,14 +9,45 @@ N = period
 
 import numpy as np
 
+from .ring import RingWindow
 
-class iATR:
+
+class iATR(RingWindow):
     def __init__(self, period: int):
-        self.wnd = np.zeros(shape=[period], dtype=float)
+        super().__init__(period)
         self.pclose = .0
+        self.tr_sum = .0
 
     def get_next(self, high: float, low: float, close: float) -> float:
-        self.wnd = np.roll(self.wnd, -1, axis=0)
-        self.wnd[-1] = max(high - low, abs(high - self.pclose), abs(low - self.pclose))
+        tr = max(high - low, abs(high - self.pclose), abs(low - self.pclose))
+        old = self.wnd[self.head]
+        self._push(tr)
         self.pclose = close
-        return self.wnd.sum() / self.wnd.size
+        if self.head == 0:  # re-anchor the running sum once per period to limit float drift
+            self.tr_sum = self.wnd.sum()
+        else:
+            self.tr_sum += tr - old
+        return self.tr_sum / self.period
+
+    def update_many(self, high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+        """
+        batch version of get_next, returns ATR for every bar and leaves the same state
+        """
+        high = np.asarray(high, dtype=float)
+        low = np.asarray(low, dtype=float)
+        close = np.asarray(close, dtype=float)
+        if len(close) == 0:
+            return np.empty(0, dtype=float)
+        pclose = np.concatenate(([self.pclose], close[:-1]))
+        tr = np.maximum(np.maximum(high - low, np.abs(high - pclose)), np.abs(low - pclose))
+        sums = self._running_sums(tr, self.tr_sum)
+        self._push_many(tr)
+        self.pclose = close[-1]
+        self.tr_sum = sums[-1]
+        return sums / self.period
+
+    @classmethod
+    def from_history(cls, period: int, high: np.ndarray, low: np.ndarray, close: np.ndarray) -> 'iATR':
+        ind = cls(period)
+        ind.update_many(high, low, close)
+        return ind
@@ -13,27 +13,53 @@ where:
 
 import numpy as np
 
+from .kernels import NUMBA, ema_run
+from .ring import RingWindow
+
 
 '''
 period = len(initial_values) // 2
 '''
-class iEMA:
+class iEMA(RingWindow):
     def calc(self, v: float):
-        self.wnd[-1] = (v - self.wnd[-2]) * self.a + self.wnd[-2]
+        # the window keeps the history of EMA values, the newest one is right before the head
+        prev = self.wnd[self.head - 1]
+        self._push((v - prev) * self.a + prev)
 
     def __init__(self, initial_values: np.array):
         n = len(initial_values) // 2
+        super().__init__(n)
         self.a = 2 / (n+1)
-        self.wnd = np.zeros(n, dtype=float)
         self.wnd[-1] = np.mean(initial_values[:n])
         for v in initial_values[n:n*2]:
-            self.wnd = np.roll(self.wnd, -1, axis=0)
             self.calc(v)
 
     def get_next(self, v):
-        # roll the window
-        self.wnd = np.roll(self.wnd, -1, axis=0)
-        self.wnd[-1] = v
-        # calculate the indicator
+        # calculate the indicator and shift the window
         self.calc(v)
-        return self.wnd[-1]
+        return self.wnd[self.head - 1]
+
+    def update_many(self, values: np.ndarray) -> np.ndarray:
+        """
+        batch version of get_next, returns EMA for every value and leaves the same state.
+        The recursion runs as a scalar loop over floats: a linear filter (lfilter) would reassociate it
+        and could not reproduce the streaming values bit for bit.
+        """
+        a = self.a
+        prev = float(self.wnd[self.head - 1])
+        if NUMBA:
+            out = ema_run(np.asarray(values, dtype=float), prev, a)
+        else:
+            out = []
+            for v in np.asarray(values, dtype=float).tolist():
+                prev = (v - prev) * a + prev
+                out.append(prev)
+            out = np.array(out, dtype=float)
+        self._push_many(out)
+        return out
+
+    @classmethod
+    def from_history(cls, period: int, values: np.ndarray) -> 'iEMA':
+        ind = cls(values[:period * 2])
+        ind.update_many(values[period * 2:])
+        return ind
@@ -0,0 +1,219 @@
+'''
+Multi-series indicator engine (struct-of-arrays)
+
+Each class keeps the state of N parallel series (assets, timeframes, features) in 2-D NumPy arrays,
+and one update(values[N]) call advances all of them at once instead of N indicator objects.
+Every series gives the same values as the corresponding single-series indicator:
+vSMA ~ iSMA, vEMA ~ iEMA, vHMA ~ iHMA, vZLEMA ~ iZLEMA, vATR ~ iATR, vLSMA ~ iLSMA, vKAMA ~ iKAMA, vFractals ~ iFractals.
+iZigZag and iLevels are path-dependent per series (pivots, point stores) and have no engine class.
+
+Windows are stored as wnd[N, period] (each series contiguous) with one head index shared by all series.
+The arrays returned by update are the internal state, copy them if they should be kept.
+'''
+
+import numpy as np
+
+
+class RingWindows:
+    def __init__(self, n: int, period: int, dtype=float):
+        self.n = n
+        self.period = period
+        self.wnd = np.zeros((n, period), dtype=dtype)
+        self.head = 0
+
+    def _fill(self, values: np.ndarray):
+        """
+        set the windows from ordered values [N, >= period] (oldest first)
+        """
+        self.wnd[:] = values[:, -self.period:]
+        self.head = 0
+
+    def _push(self, v: np.ndarray):
+        self.wnd[:, self.head] = v
+        self.head += 1
+        if self.head == self.period:
+            self.head = 0
+
+    def window(self, out: np.ndarray = None) -> np.ndarray:
+        """
+        ordered windows [N, period] (oldest first)
+        """
+        if out is None:
+            out = np.empty_like(self.wnd)
+        k = self.period - self.head
+        out[:, :k] = self.wnd[:, self.head:]
+        out[:, k:] = self.wnd[:, :self.head]
+        return out
+
+
+class vSMA(RingWindows):
+    def __init__(self, n: int, period: int):
+        super().__init__(n, period)
+        self.SMA = np.zeros(n, dtype=float)
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        self.SMA -= self.wnd[:, self.head] / self.period
+        self.SMA += values / self.period
+        self._push(values)
+        return self.SMA
+
+
+class vEMA:
+    '''
+    initial_values[N, 2*period]
+    '''
+    def __init__(self, initial_values: np.ndarray):
+        period = initial_values.shape[1] // 2
+        self.a = 2 / (period + 1)
+        self.EMA = np.mean(initial_values[:, :period], axis=1)
+        for v in initial_values[:, period:period * 2].T:
+            self.update(v)
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        self.EMA += (values - self.EMA) * self.a
+        return self.EMA
+
+
+class vHMA(vEMA):
+    '''
+    initial_values[N, 2*period], see iHMA
+    '''
+    def __init__(self, period: int, initial_values: np.ndarray):
+        self.a = 2 / (period + 1)
+        self.EMA = np.mean(initial_values[:, :period], axis=1)
+        for v in initial_values[:, period:period * 2].T:
+            self.update(v)
+
+
+class vZLEMA(RingWindows):
+    '''
+    initial_values[N, 2*period], see iZLEMA
+    '''
+    def __init__(self, initial_values: np.ndarray):
+        n, ni = initial_values.shape
+        lag = ni // 2 // 2
+        super().__init__(n, lag)
+        self._fill(initial_values[:, :lag])
+        self.ema = vEMA(2 * initial_values[:, lag:] - initial_values[:, :ni - lag])
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        self._push(values)
+        return self.ema.update(2 * values - self.wnd[:, self.head])
+
+
+class vATR(RingWindows):
+    def __init__(self, n: int, period: int):
+        super().__init__(n, period)
+        self.pclose = np.zeros(n, dtype=float)
+        self.tr_sum = np.zeros(n, dtype=float)
+        self.tr = np.empty(n, dtype=float)
+
+    def update(self, high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+        tr = np.maximum(np.maximum(high - low, np.abs(high - self.pclose)), np.abs(low - self.pclose), out=self.tr)
+        old = self.wnd[:, self.head].copy()
+        self._push(tr)
+        self.pclose[:] = close
+        if self.head == 0:  # re-anchor the running sums once per period
+            self.tr_sum = self.wnd.sum(axis=1)
+        else:
+            self.tr_sum += tr - old
+        return self.tr_sum / self.period
+
+
+class vLSMA(RingWindows):
+    '''
+    initial_values[N, period]
+    '''
+    def __init__(self, initial_values: np.ndarray):
+        n, period = initial_values.shape
+        super().__init__(n, period)
+        self._fill(initial_values)
+        self.x = np.arange(1, period + 1, dtype=float)
+        self.x_sum = np.sum(self.x)
+        self.x_sum2 = self.x_sum ** 2
+        self.x2_sum = np.sum(self.x ** 2)
+        self.xy = np.empty_like(self.wnd)  # preallocated buffer for re-anchoring
+        self.anchor()
+
+    # exact sums, the head must be at 0
+    def anchor(self):
+        self.y_sum = self.wnd.sum(axis=1)
+        self.xy_sum = np.multiply(self.wnd, self.x, out=self.xy).sum(axis=1)
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        old = self.wnd[:, self.head].copy()
+        self._push(values)
+        if self.head == 0:  # re-anchor the running sums once per period
+            self.anchor()
+        else:
+            self.xy_sum += self.period * values - self.y_sum
+            self.y_sum += values - old
+        m = (self.period * self.xy_sum - self.x_sum * self.y_sum) / (self.period * self.x2_sum - self.x_sum2)
+        c = (self.y_sum - m * self.x_sum) / self.period
+        return m * self.period + c
+
+
+class vKAMA(RingWindows):
+    '''
+    initial_values[N, period]
+    '''
+    def __init__(self, fastSC: float, slowSC: float, initial_values: np.ndarray):
+        n, period = initial_values.shape
+        super().__init__(n, period)
+        self._fill(initial_values)
+        self.diffs = RingWindows(n, period - 1)
+        self.diffs._fill(np.abs(np.diff(self.wnd, axis=1)))
+        self.volatility = self.diffs.wnd.sum(axis=1)
+        self.sSC = slowSC
+        self.fSC_sSC = fastSC - slowSC
+        self.KAMA = np.zeros(n, dtype=float)
+        self.calc()
+
+    def calc(self):
+        last = self.wnd[:, self.head - 1]
+        ER = np.abs(last - self.wnd[:, self.head]) / self.volatility
+        SC = (ER * self.fSC_sSC + self.sSC) ** 2
+        self.KAMA += SC * (last - self.KAMA)
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        d = np.abs(values - self.wnd[:, self.head - 1])
+        old = self.diffs.wnd[:, self.diffs.head].copy()
+        self.diffs._push(d)
+        if self.diffs.head == 0:  # re-anchor the running sums once per period
+            self.volatility = self.diffs.wnd.sum(axis=1)
+        else:
+            self.volatility += d - old
+        self._push(values)
+        self.calc()
+        return self.KAMA
+
+
+class vFractals:
+    def __init__(self, n: int, period: int, tolerance: float = .0):
+        self.ktlr = tolerance + 1.0
+        self.ipvt = period // 2  # center pivot index
+        self.prev_high = np.zeros(n, dtype=float)
+        self.prev_low = np.zeros(n, dtype=float)
+        # windows of rises and falls as bit masks (newest value in bit 0), see iFractals
+        self.mask = (1 << period) - 1
+        self.rises = np.zeros(n, dtype=np.int64)
+        self.falls = np.zeros(n, dtype=np.int64)
+        self.head_pattern = ((1 << self.ipvt) - 1) << (period - self.ipvt)
+        self.tail_pattern = (1 << (period - self.ipvt)) - 1
+        self.signal = np.zeros(n, dtype=np.int8)
+
+    def update(self, high: np.ndarray, low: np.ndarray) -> np.ndarray:
+        """
+        1 => bullish fractal (local max)
+        -1 => bearish fractal (local min)
+        """
+        rise = self.prev_high < high / self.ktlr
+        fall = ~rise & (self.prev_low > low * self.ktlr)
+        self.rises = ((self.rises << 1) | rise) & self.mask
+        self.falls = ((self.falls << 1) | fall) & self.mask
+        self.prev_high[:] = high
+        self.prev_low[:] = low
+        self.signal[:] = 0
+        self.signal[(self.falls == self.tail_pattern) & (self.rises == self.head_pattern)] = 1
+        self.signal[(self.rises == self.tail_pattern) & (self.falls == self.head_pattern)] = -1
+        return self.signal
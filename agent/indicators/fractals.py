@@ -10,8 +10,10 @@ Lᵢ₋₄ > Lᵢ₋₃ > Lᵢ₋₂ < Lᵢ₋₁ < Lᵢ => bearish fractal (loc
 import numpy as np
 # from line_profiler import profile
 
+from .ring import RingWindow
 
-class iFractals:
+
+class iFractals(RingWindow):
 
     def __init__(self, period: int, tolerance: float = .0):
         """
@@ -19,19 +21,22 @@ class iFractals:
         tolerance: relative part of difference of adjacent values
         """
         # todo: add assert for nonparity of period
-        self.wnd = np.zeros(shape=period, dtype=int)
+        super().__init__(period, dtype=np.int8)
         self.ktlr = tolerance + 1.0
         self.ipvt = period // 2  # center pivot index
         self.prev_high = self.prev_low = 0.
+        # the window is mirrored into bit masks of rises and falls (newest value in bit 0) to match patterns in O(1)
+        self.mask = (1 << period) - 1
+        self.rises = self.falls = 0
+        self.head_pattern = ((1 << self.ipvt) - 1) << (period - self.ipvt)  # ipvt oldest values
+        self.tail_pattern = (1 << (period - self.ipvt)) - 1  # the rest newest values
 
     # @profile
     def calc(self) -> int:
-        if np.all(self.wnd[self.ipvt:] == -1):
-            if np.all(self.wnd[:self.ipvt] == 1):
-                return 1  # local max - bullish fractal (^)
-        elif np.all(self.wnd[self.ipvt:] == 1):
-            if np.all(self.wnd[:self.ipvt] == -1):
-                return -1  # local min - bearish fractal (v)
+        if self.falls == self.tail_pattern and self.rises == self.head_pattern:
+            return 1  # local max - bullish fractal (^)
+        if self.rises == self.tail_pattern and self.falls == self.head_pattern:
+            return -1  # local min - bearish fractal (v)
         return 0
 
     # @profile
@@ -40,13 +45,67 @@ class iFractals:
         1 => bullish fractal (local max)
         -1 => bearish fractal (local min)
         """
-        self.wnd = np.roll(self.wnd, -1, axis=0)
+        rise = fall = 0
         if self.prev_high < high / self.ktlr:
-            self.wnd[-1] = 1
+            rise = 1
         elif self.prev_low > low * self.ktlr:
-            self.wnd[-1] = -1
-        else:
-            self.wnd[-1] = 0
+            fall = 1
+        self._push(rise - fall)
+        self.rises = ((self.rises << 1) | rise) & self.mask
+        self.falls = ((self.falls << 1) | fall) & self.mask
         self.prev_high = high
         self.prev_low = low
         return self.calc()
+
+    def update_many(self, high: np.ndarray, low: np.ndarray) -> np.ndarray:
+        """
+        batch version of get_next, returns int8 signals for every bar and leaves the same state
+        """
+        high = np.asarray(high, dtype=float)
+        low = np.asarray(low, dtype=float)
+        m = len(high)
+        if m == 0:
+            return np.empty(0, dtype=np.int8)
+        prev_high = np.concatenate(([self.prev_high], high[:-1]))
+        prev_low = np.concatenate(([self.prev_low], low[:-1]))
+        rise = prev_high < high / self.ktlr
+        fall = ~rise & (prev_low > low * self.ktlr)
+        signs = rise.astype(np.int8) - fall.astype(np.int8)
+        hist = self._history(signs)
+        # match the patterns by the lengths of runs of rises and falls over the history instead of per-bar windows:
+        # the tail pattern ends at the bar, the head pattern ends period - ipvt bars earlier
+        ntail = self.period - self.ipvt
+        rises = _run_lengths(hist == 1)
+        falls = _run_lengths(hist == -1)
+        bullish = (falls[self.period:] >= ntail) & (rises[self.ipvt:self.ipvt + m] >= self.ipvt)
+        bearish = (rises[self.period:] >= ntail) & (falls[self.ipvt:self.ipvt + m] >= self.ipvt)
+        self._push_many(signs)
+        self.prev_high = high[-1]
+        self.prev_low = low[-1]
+        self.rises = self.falls = 0
+        for sign in self.window().tolist():
+            self.rises = (self.rises << 1) | (sign == 1)
+            self.falls = (self.falls << 1) | (sign == -1)
+        return bullish.astype(np.int8) - bearish.astype(np.int8)
+
+    @classmethod
+    def from_history(cls, period: int, tolerance: float, high: np.ndarray, low: np.ndarray) -> 'iFractals':
+        ind = cls(period, tolerance)
+        ind.update_many(high, low)
+        return ind
+
+
+def _run_lengths(mask: np.ndarray) -> np.ndarray:
+    """
+    length of the run of True values ending at each index of mask (0 for False)
+    """
+    idx = np.arange(1, len(mask) + 1)
+    return idx - np.maximum.accumulate(np.where(mask, 0, idx))
+
+
+def fractals_scan(high: np.ndarray, low: np.ndarray, period: int, tolerance: float = .0) -> np.ndarray:
+    """
+    fractal signals of the whole series (e.g. for research and warmup), O(len) for any period.
+    The same int8 signals as get_next of a new iFractals(period, tolerance) for each bar.
+    """
+    return iFractals(period, tolerance).update_many(high, low)
@@ -9,17 +9,47 @@ HMA = WMA(2*WMA(n/2) − WMA(n)),sqrt(n))
 
 import numpy as np
 
-class iHMA:
+from .kernels import NUMBA, ema_run
+from .ring import RingWindow
+
+
+class iHMA(RingWindow):
+    def calc(self, v: float):
+        # the window keeps the history of MA values, the newest one is right before the head
+        prev = self.wnd[self.head - 1]
+        self._push((v - prev) * self.m + prev)
+
     def __init__(self, period: int, initial_values: np.array):
+        super().__init__(period)
         self.m = 2 / (period + 1)
-        self.wnd = np.zeros(period, dtype=float)
         self.wnd[-1] = np.mean(initial_values[:period])
         for v in initial_values[period:period*2]:
-            self.wnd = np.roll(self.wnd, -1, axis=0)
-            self.wnd[-1] = (v - self.wnd[-2]) * self.m + self.wnd[-2]
+            self.calc(v)
 
     def get_next(self, v):
-        self.wnd = np.roll(self.wnd, -1, axis=0)
-        self.wnd[-1] = v
-        self.wnd[-1] = (v - self.wnd[-2]) * self.m + self.wnd[-2]
-        return self.wnd[-1]
+        self.calc(v)
+        return self.wnd[self.head - 1]
+
+    def update_many(self, values: np.ndarray) -> np.ndarray:
+        """
+        batch version of get_next, returns MA for every value and leaves the same state
+        (scalar loop to keep the recursion bit-exact, see iEMA.update_many)
+        """
+        m = self.m
+        prev = float(self.wnd[self.head - 1])
+        if NUMBA:
+            out = ema_run(np.asarray(values, dtype=float), prev, m)
+        else:
+            out = []
+            for v in np.asarray(values, dtype=float).tolist():
+                prev = (v - prev) * m + prev
+                out.append(prev)
+            out = np.array(out, dtype=float)
+        self._push_many(out)
+        return out
+
+    @classmethod
+    def from_history(cls, period: int, values: np.ndarray) -> 'iHMA':
+        ind = cls(period, values[:period * 2])
+        ind.update_many(values[period * 2:])
+        return ind
@@ -9,16 +9,24 @@ where:
 • ER is the Efficiency Ratio, change divided by volatility.
 • SC is the Smoothing Constant.
 • The fastest SC and the slowest SC are typically set at 2/(2+1) and 2/(30+1) respectively.
+
+The volatility Σ|v(j)-v(j-1)| is a running sum over a ring of absolute differences,
+updated in O(1) per value and re-anchored by exact summation once per period.
 '''
 
 import numpy as np
 
+from .kernels import NUMBA, kama_run
+from .ring import RingWindow
+
 
-class iKAMA:
+class iKAMA(RingWindow):
     def calc(self):
-        ER = np.abs(self.wnd[-1]-self.wnd[0]) / np.sum(np.abs(np.diff(self.wnd)))  #todo: optimize for speed
-        SC = (ER * self.fSC_sSC + self.sSC) ** 2
-        return self.KAMAprev + SC * (self.wnd[-1] - self.KAMAprev)
+        last = self.wnd[self.head - 1]
+        ER = np.abs(last - self.wnd[self.head]) / self.volatility
+        SC = ER * self.fSC_sSC + self.sSC
+        SC *= SC  # a scalar ** 2 goes through pow() and may differ in the last bit from the array square of update_many
+        return self.KAMAprev + SC * (last - self.KAMAprev)
 
     '''
     fastest_SC = 2 / (2 + 1)
@@ -26,14 +34,69 @@ class iKAMA:
     period = len(initial_values)
     '''
     def __init__(self, fastSC: float, slowSC: float, initial_values: np.array):
+        super().__init__(len(initial_values))
+        self._fill(initial_values)
+        # absolute differences of adjacent values in the window
+        self.diffs = RingWindow(self.period - 1)
+        self.diffs._fill(np.abs(np.diff(self.wnd)))
+        self.volatility = self.diffs.wnd.sum()
         self.sSC = slowSC
         self.fSC_sSC = fastSC - slowSC
-        self.wnd = np.copy(initial_values)
         self.KAMAprev = 0.
         self.KAMAprev = self.calc()
 
     def get_next(self, v):
-        self.wnd = np.roll(self.wnd, -1, axis=0)
-        self.wnd[-1] = v
+        d = np.abs(v - self.wnd[self.head - 1])
+        old = self.diffs.wnd[self.diffs.head]
+        self.diffs._push(d)
+        if self.diffs.head == 0:  # re-anchor the running sum once per period to limit float drift
+            self.volatility = self.diffs.wnd.sum()
+        else:
+            self.volatility += d - old
+        self._push(v)
         self.KAMAprev = self.calc()
         return self.KAMAprev
+
+    def update_many(self, values: np.ndarray) -> np.ndarray:
+        """
+        batch version of get_next, returns KAMA for every value and leaves the same state.
+        ER and SC are vectorized, the KAMA recursion runs as a scalar loop to stay bit-exact.
+        """
+        values = np.asarray(values, dtype=float)
+        m = len(values)
+        if m == 0:
+            return np.empty(0, dtype=float)
+        hist = self._history(values)
+        d = np.abs(values - hist[self.period - 1:self.period - 1 + m])
+        volatility = self.diffs._running_sums(d, self.volatility)
+        ER = np.abs(values - hist[1:m + 1]) / volatility
+        SC = (ER * self.fSC_sSC + self.sSC) ** 2
+        if NUMBA:
+            out = kama_run(values, SC, float(self.KAMAprev))
+        else:
+            kama = self.KAMAprev
+            out = []
+            for sc, v in zip(SC.tolist(), values.tolist()):
+                kama = kama + sc * (v - kama)
+                out.append(kama)
+        self.diffs._push_many(d)
+        self._push_many(values)
+        self.volatility = volatility[-1]
+        self.KAMAprev = out[-1]
+        return np.array(out, dtype=float)
+
+    @classmethod
+    def from_history(cls, fastSC: float, slowSC: float, period: int, values: np.ndarray) -> 'iKAMA':
+        ind = cls(fastSC, slowSC, values[:period])
+        ind.update_many(values[period:])
+        return ind
+
+
+def kama_series(values: np.ndarray, fastSC: float, slowSC: float, period: int) -> np.ndarray:
+    """
+    KAMA of the whole series (e.g. for backtests and warmup), bit for bit the same as streaming:
+    iKAMA(fastSC, slowSC, values[:period]) followed by get_next for each of the rest values.
+    Returns len(values) - period + 1 values, the first one is KAMA of the initial window.
+    """
+    ind = iKAMA(fastSC, slowSC, values[:period])
+    return np.concatenate(([ind.KAMAprev], ind.update_many(values[period:])))
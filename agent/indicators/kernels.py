@@ -0,0 +1,63 @@
+'''
+Compiled kernels for the batch loops of the indicators
+
+The backend is selected in agent.kernels (NUMBA, kernel):
+• the batch calls (update_many, series) use the kernels only when NUMBA is True, otherwise they run their pure NumPy code
+• get_next stays pure Python with either backend: the dispatch of a compiled call costs more than a scalar step
+  (see the backends case of agent.tests.indicators_bench)
+• kernel.py_func is the Python version of a kernel with either backend (for parity tests)
+'''
+
+import numpy as np
+
+from agent.kernels import NUMBA, kernel
+
+
+@kernel
+def ema_run(values, prev, a):
+    """
+    MA recursion over values starting from prev, see iEMA.update_many
+    """
+    out = np.empty(len(values))
+    for i in range(len(values)):
+        prev = (values[i] - prev) * a + prev
+        out[i] = prev
+    return out
+
+
+@kernel
+def kama_run(values, SC, kama):
+    """
+    KAMA recursion over values with smoothing constants SC starting from kama, see iKAMA.update_many
+    """
+    out = np.empty(len(values))
+    for i in range(len(values)):
+        kama = kama + SC[i] * (values[i] - kama)
+        out[i] = kama
+    return out
+
+
+@kernel
+def zigzag_run(values, trend, last_pivot_x, up_thresh, down_thresh):
+    """
+    iZigZag.get_next over values, returns (int8 pivots, trend, last_pivot_x)
+    """
+    out = np.zeros(len(values), dtype=np.int8)
+    for i in range(len(values)):
+        x = values[i]
+        r = x / last_pivot_x
+        if trend == -1:
+            if r >= up_thresh:
+                out[i] = trend
+                trend = 1
+                last_pivot_x = x
+            elif x < last_pivot_x:
+                last_pivot_x = x
+        else:
+            if r <= down_thresh:
+                out[i] = trend
+                trend = -1
+                last_pivot_x = x
+            elif x > last_pivot_x:
+                last_pivot_x = x
+    return out, trend, last_pivot_x
@@ -2,51 +2,35 @@
 Support and Resistance Levels indicator
 
 Computation:
-1. run fractals indicator on the data window
-2. add previous levels to given points
-3. sort the points
-4. clusterize the points
-5. return centroids of clusters as found levels
+1. run fractals indicator on each new bar, the pivot of a found fractal is a new point (high for ^, low for v)
+2. insert the point into the sorted array of live points (bisect)
+3. points older than the lifetime are removed (decay of old levels), the oldest ones also above the max points count
+4. clusters are runs of sorted points with relative distance of neighbours <= eps,
+   only the clusters around inserted/removed points are rebuilt (local merge/split)
+5. centroids and points counts of clusters above the threshold are the found levels
+
+The max points count bounds the memory and the O(points) insert cost of a long-running indicator even without a lifetime.
+
+The output differs from the previous implementation, which replayed the fractals over the tail of the window on every bar
+and re-clustered all points together with the previous levels:
+• every fractal pivot is a single point, counted once (the low for a bearish fractal, the previous code took the high for both)
+• a level is a cluster of live points only, the points count of a level is the count of live points in it
+• points expire by level_lifetime and level_max_points, the previous levels never decayed
+get_next, update_many and levels() return the same kind of array as before: a float32 copy [[centroid, points count]],
+np.array([]) of shape (0,) if there are no levels.
 '''
 
+from collections import deque
+
 import numpy as np
 # from line_profiler import profile
 
 from .fractals import iFractals
+from .ring import RingWindow
 
 
-class iLevels:
-    # @profile
-    def calc(self):
-        pts = []
-        for v in self.wnd[-self.fractals_period:]:  # check for new reversal point
-            fr = self.ifr.get_next(v[0], v[1]) != 0
-            if fr == 1:
-                pts.append([v[0], 1])
-            elif fr == -1:
-                pts.append([v[1], 1])
-        if len(pts) == 0:
-            return
-        pts += self.levels
-        pts = sorted(pts)  # sorting by axis 0
-        clusters = []
-        pt1 = pts[0]
-        curr_cluster = [pt1]
-        for pt in pts[1:]:
-            if pt[0] / pt1[0] <= self.keps:
-                curr_cluster.append(pt)
-            else:
-                clusters.append(curr_cluster)
-                curr_cluster = [pt]
-            pt1 = pt
-        clusters.append(curr_cluster)
-        levels = []
-        for clr in clusters:
-            vsum = sum(pt[0]*pt[1] for pt in clr)
-            nsum = sum(pt[1] for pt in clr)
-            if nsum > self.points_thres:
-                levels.append([vsum / nsum, nsum])  # save centroid and points count
-        self.levels = levels
+class iLevels(RingWindow):
+    INIT_CAPACITY = 64
 
     '''
     initial_value = [[high, low]]
@@ -54,18 +38,119 @@ class iLevels:
     fractals_period
     fractals_tolerance
     eps = radius to clusterize fractal points
+    level_points_thres = minimal points count of a cluster to be a level (exclusive)
+    level_lifetime = lifetime of a point in bars, 0 = infinite
+    level_max_points = max count of live points, the oldest ones are removed above it
     '''
-    def __init__(self, initial_values: np.array, fractals_period: int, fractals_tolerance: float, level_eps: float, level_points_thres: int):
-        self.wnd = np.copy(initial_values)
-        self.fractals_period = fractals_period
+    def __init__(self, initial_values: np.array, fractals_period: int, fractals_tolerance: float, level_eps: float, level_points_thres: int,
+                 level_lifetime: int = 0, level_max_points: int = 1000):
+        super().__init__(len(initial_values), item_shape=(2,))
         self.ifr = iFractals(fractals_period, fractals_tolerance)
+        self.ipivot = fractals_period // 2 - fractals_period - 1  # logical index of the fractal pivot bar in the window
+        assert self.period >= -self.ipivot, f"window size {self.period} is less than needed for fractals of period {fractals_period}"
         self.keps = 1.0 + level_eps
         self.points_thres = level_points_thres
-        self.levels = []
+        self.lifetime = level_lifetime
+        self.max_points = level_max_points
+        self.t = 0
+        self.born = deque()  # (bar, price) of live points in order of appearance
+        self.pts = np.empty(self.INIT_CAPACITY, dtype=float)  # sorted live points
+        self.n_pts = 0
+        self.lv = np.empty((self.INIT_CAPACITY, 2), dtype=float)  # sorted levels: [centroid, points count]
+        self.n_lv = 0
+        for high, low in initial_values:
+            self.update(high, low)
+
+    def levels(self) -> np.ndarray:
+        """
+        copy of the current levels as float32 [[centroid, points count]], shape (0,) if there are no levels
+        """
+        return np.array(self.lv[:self.n_lv] if self.n_lv else [], dtype=np.float32)
+
+    # @profile
+    def update(self, high: float, low: float):
+        self._push((high, low))
+        self.t += 1
+        fr = self.ifr.get_next(high, low)
+        if fr != 0:
+            pivot = self._at(self.ipivot)
+            self.insert(pivot[0] if fr == 1 else pivot[1])
+        if self.lifetime:
+            while self.born and self.born[0][0] <= self.t - self.lifetime:
+                self.remove(self.born.popleft()[1])
+        while len(self.born) > self.max_points:
+            self.remove(self.born.popleft()[1])
+
+    def insert(self, price: float):
+        n = self.n_pts
+        if n == len(self.pts):
+            self.pts = np.concatenate((self.pts, np.empty(n, dtype=float)))
+        i = np.searchsorted(self.pts[:n], price)
+        self.pts[i + 1:n + 1] = self.pts[i:n]
+        self.pts[i] = price
+        self.n_pts += 1
+        self.born.append((self.t, price))
+        # the cluster of the new point, it may have merged neighbour clusters
+        lo, hi = self._cluster_bounds(i)
+        self._replace_levels(self.pts[lo], self.pts[hi - 1], lo, hi)
+
+    def remove(self, price: float):
+        i = np.searchsorted(self.pts[:self.n_pts], price)
+        # the cluster of the removed point, it may split
+        lo, hi = self._cluster_bounds(i)
+        p_lo, p_hi = self.pts[lo], self.pts[hi - 1]
+        self.pts[i:self.n_pts - 1] = self.pts[i + 1:self.n_pts]
+        self.n_pts -= 1
+        self._replace_levels(p_lo, p_hi, lo, hi - 1)
+
+    def _cluster_bounds(self, i: int) -> (int, int):
+        pts = self.pts
+        lo = i
+        while lo > 0 and pts[lo] / pts[lo - 1] <= self.keps:
+            lo -= 1
+        hi = i + 1
+        while hi < self.n_pts and pts[hi] / pts[hi - 1] <= self.keps:
+            hi += 1
+        return lo, hi
+
+    def _replace_levels(self, p_lo: float, p_hi: float, lo: int, hi: int):
+        """
+        replace the levels with centroids in [p_lo, p_hi] by the clusters of points[lo:hi]
+        """
+        new = []
+        start = lo
+        for j in range(lo + 1, hi + 1):
+            if j == hi or self.pts[j] / self.pts[j - 1] > self.keps:
+                if j - start > self.points_thres:
+                    new.append((self.pts[start:j].mean(), j - start))
+                start = j
+        n = self.n_lv
+        a = np.searchsorted(self.lv[:n, 0], p_lo, side="left")
+        b = np.searchsorted(self.lv[:n, 0], p_hi, side="right")
+        k = len(new)
+        if n - (b - a) + k > len(self.lv):
+            self.lv = np.concatenate((self.lv, np.empty_like(self.lv)))
+        self.lv[a + k:n - (b - a) + k] = self.lv[b:n]
+        if k:
+            self.lv[a:a + k] = new
+        self.n_lv = n - (b - a) + k
 
     def get_next(self, high: float, low: float) -> np.ndarray:
-        self.wnd = np.roll(self.wnd, -1, axis=0)
-        self.wnd[-1, 0] = high
-        self.wnd[-1, 1] = low
-        self.calc()
-        return np.array(self.levels, dtype=np.float32)
+        self.update(high, low)
+        return self.levels()
+
+    def update_many(self, high: np.ndarray, low: np.ndarray) -> np.ndarray:
+        """
+        batch version of get_next, returns the levels after the last bar and leaves the same state
+        """
+        for hl in zip(np.asarray(high, dtype=float).tolist(), np.asarray(low, dtype=float).tolist()):
+            self.update(*hl)
+        return self.levels()
+
+    @classmethod
+    def from_history(cls, period: int, fractals_period: int, fractals_tolerance: float, level_eps: float, level_points_thres: int,
+                     high: np.ndarray, low: np.ndarray, level_lifetime: int = 0, level_max_points: int = 1000) -> 'iLevels':
+        ind = cls(np.stack((high[:period], low[:period]), axis=1), fractals_period, fractals_tolerance, level_eps, level_points_thres,
+                  level_lifetime, level_max_points)
+        ind.update_many(high[period:], low[period:])
+        return ind
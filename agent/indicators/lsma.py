@@ -15,29 +15,91 @@ where:
     • ∑x is the sum of x values.
     • ∑y is the sum of y values (prices).
     • ∑x² is the sum of the squares of x values.
+
+Incremental update in O(1) per value (v is the new value, y₁ is the dropped oldest one):
+    ∑xy' = ∑xy + n·v - ∑y
+    ∑y' = ∑y + v - y₁
+both sums are re-anchored by exact summation once per period to limit float drift.
 '''
 
 import numpy as np
 
-class iLSMA:
+from .ring import RingWindow
+
+
+class iLSMA(RingWindow):
 
     def calc(self):
-        m = (self.n * np.sum(self.x * self.wnd) - self.x_sum * np.sum(self.wnd)) / (self.n * self.x2_sum - self.x_sum2)
-        c = (np.sum(self.wnd) - m * self.x_sum) / self.n
+        m = (self.n * self.xy_sum - self.x_sum * self.y_sum) / (self.n * self.x2_sum - self.x_sum2)
+        c = (self.y_sum - m * self.x_sum) / self.n
         return m * self.n + c  # The projected value at the end of the period
 
+    # exact sums, the head must be at 0 (the window is in the logical order)
+    def anchor(self):
+        self.y_sum = np.sum(self.wnd)
+        self.xy_sum = np.sum(np.multiply(self.x, self.wnd, out=self.xy))
+
     '''
     period = len(initial_values)
     '''
     def __init__(self, initial_values: np.array):
         self.n = len(initial_values)
+        super().__init__(self.n)
+        self._fill(initial_values)
         self.x = np.array(range(1, self.n+1)).astype(float)
         self.x_sum = np.sum(self.x)
         self.x_sum2 = self.x_sum ** 2
         self.x2_sum = np.sum(self.x ** 2)
-        self.wnd = np.copy(initial_values)
+        self.xy = np.empty(self.n, dtype=float)  # preallocated buffer for re-anchoring
+        self.anchor()
 
     def get_next(self, v):
-        self.wnd = np.roll(self.wnd, -1, axis=0)
-        self.wnd[-1] = v
+        v = float(v)
+        old = self.wnd[self.head]
+        self._push(v)
+        if self.head == 0:  # re-anchor the running sums once per period
+            self.anchor()
+        else:
+            self.xy_sum += self.n * v - self.y_sum
+            self.y_sum += v - old
         return self.calc()
+
+    def update_many(self, values: np.ndarray) -> np.ndarray:
+        """
+        batch version of get_next, returns LSMA for every value and leaves the same state
+        """
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return np.empty(0, dtype=float)
+        hist = self._history(values)
+        y_sum = self._running_sums(values, self.y_sum)
+        y_prev = np.concatenate(([self.y_sum], y_sum[:-1]))
+        windows = np.lib.stride_tricks.sliding_window_view(hist, self.n)
+        xy_sum = self._accumulate(self.n * values - y_prev, self.xy_sum, lambda steps: (windows[steps + 1] * self.x).sum(axis=1))
+        self._push_many(values)
+        self.y_sum = y_sum[-1]
+        self.xy_sum = xy_sum[-1]
+        m = (self.n * xy_sum - self.x_sum * y_sum) / (self.n * self.x2_sum - self.x_sum2)
+        c = (y_sum - m * self.x_sum) / self.n
+        return m * self.n + c
+
+    @classmethod
+    def from_history(cls, period: int, values: np.ndarray) -> 'iLSMA':
+        ind = cls(values[:period])
+        ind.update_many(values[period:])
+        return ind
+
+
+def lsma_series(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    LSMA of the whole series in one vectorized call (e.g. for backtests),
+    returns len(values) - period + 1 values, one per full window
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(np.asarray(values, dtype=float), period)
+    x = np.arange(1, period + 1, dtype=float)
+    x_sum = np.sum(x)
+    xy_sum = windows @ x
+    y_sum = windows.sum(axis=1)
+    m = (period * xy_sum - x_sum * y_sum) / (period * np.sum(x ** 2) - x_sum ** 2)
+    c = (y_sum - m * x_sum) / period
+    return m * period + c
@@ -0,0 +1,114 @@
+'''
+Ring window base for sliding-window indicators
+
+Preallocated circular buffer with a head index instead of np.roll on every update:
+• wnd is the physical buffer of shape [period, ...], it is never reallocated
+• head is the physical index of the oldest value (the next one to be overwritten)
+• logical index i (0 = oldest, -1 = newest) maps to wnd[(head + i) % period]
+
+Batch helpers (_history, _push_many, _accumulate, _running_sums) are used by update_many of the indicators:
+they vectorize a series of updates and leave exactly the same state as the streaming updates.
+'''
+
+import numpy as np
+
+
+class RingWindow:
+    def __init__(self, period: int, dtype=float, item_shape: tuple = ()):
+        self.period = period
+        self.wnd = np.zeros((period,) + item_shape, dtype=dtype)
+        self.head = 0
+
+    def _fill(self, values: np.ndarray):
+        """
+        set the window from ordered values (oldest first), only the last period values are kept
+        """
+        self.wnd[:] = values[-self.period:]
+        self.head = 0
+
+    def _push(self, v):
+        """
+        overwrite the oldest value with v and advance the head, O(1)
+        """
+        self.wnd[self.head] = v
+        self.head += 1
+        if self.head == self.period:
+            self.head = 0
+
+    def _at(self, i: int):
+        """
+        value by logical index: 0 = oldest, -1 = newest
+        """
+        return self.wnd[(self.head + i) % self.period]
+
+    def window(self, out: np.ndarray = None) -> np.ndarray:
+        """
+        ordered window (oldest first), O(period)
+        out: optional preallocated buffer of the window shape to avoid allocation
+        """
+        if out is None:
+            out = np.empty_like(self.wnd)
+        n = self.period - self.head
+        out[:n] = self.wnd[self.head:]
+        out[n:] = self.wnd[:self.head]
+        return out
+
+    def _history(self, values: np.ndarray) -> np.ndarray:
+        """
+        ordered window followed by values: the window after pushing values[k] is _history(values)[k+1:k+1+period]
+        """
+        return np.concatenate((self.window(), values))
+
+    def _push_many(self, values: np.ndarray):
+        """
+        vectorized equivalent of _push for every item of values
+        """
+        m = len(values)
+        if m == 0:
+            return
+        if m >= self.period:
+            self.head = (self.head + m) % self.period
+            tail = values[-self.period:]
+            k = self.period - self.head
+            self.wnd[self.head:] = tail[:k]
+            self.wnd[:self.head] = tail[k:]
+            return
+        end = self.head + m
+        if end <= self.period:
+            self.wnd[self.head:end] = values
+        else:
+            k = self.period - self.head
+            self.wnd[self.head:] = values[:k]
+            self.wnd[:end - self.period] = values[k:]
+        self.head = end % self.period
+
+    def _accumulate(self, deltas: np.ndarray, s: float, anchors) -> np.ndarray:
+        """
+        running values of s after each update, reproducing the streaming rule bit for bit:
+            s += deltas[k], or s = anchors(k) when the head wraps around to 0 after the k-th push
+        anchors maps an array of such steps to their anchor values.
+        The updates between the wraps are laid out as rows [anchor, deltas...] of a [wraps, period] array
+        and summed by a cumsum along the rows, which adds sequentially as the streaming rule does.
+        """
+        m = len(deltas)
+        out = np.empty(m, dtype=float)
+        p0 = min(self.period - self.head - 1, m)  # the first step after which the head wraps around
+        out[:p0] = np.cumsum(np.concatenate(([s], deltas[:p0])))[1:]
+        if p0 == m:
+            return out
+        steps = np.arange(p0, m, self.period)
+        blocks = np.zeros((len(steps), self.period), dtype=float)
+        blocks.ravel()[:m - p0] = deltas[p0:]
+        blocks[:, 0] = anchors(steps)
+        out[p0:] = np.cumsum(blocks, axis=1).ravel()[:m - p0]
+        return out
+
+    def _running_sums(self, values: np.ndarray, s: float) -> np.ndarray:
+        """
+        running window sums after pushing each of values, starting from the sum s of the current window.
+        Reproduces the streaming rule (call it before _push_many):
+            s += v - oldest, or s = wnd.sum() when the head wraps around to 0
+        """
+        hist = self._history(values)
+        windows = np.lib.stride_tricks.sliding_window_view(hist, self.period)
+        return self._accumulate(values - hist[:len(values)], s, lambda steps: windows[steps + 1].sum(axis=1))
@@ -4,17 +4,41 @@ Simple Moving Average indicator
 
 import numpy as np
 
+from .ring import RingWindow
 
-class iSMA:
+
+class iSMA(RingWindow):
     def __init__(self, period: int):
-        self.wnd = np.zeros(period, dtype=float)
+        super().__init__(period)
         self.SMA = 0.0
 
     def get_next(self, v):
         # change mean sum
-        self.SMA -= self.wnd[0] / self.wnd.size
-        self.SMA += v / self.wnd.size
-        # roll the window
-        self.wnd = np.roll(self.wnd, -1, axis=0)
-        self.wnd[-1] = v
+        self.SMA -= self.wnd[self.head] / self.period
+        self.SMA += v / self.period
+        # shift the window
+        self._push(v)
         return self.SMA
+
+    def update_many(self, values: np.ndarray) -> np.ndarray:
+        """
+        batch version of get_next, returns SMA for every value and leaves the same state
+        """
+        values = np.asarray(values, dtype=float)
+        olds = self._history(values)[:len(values)]
+        # interleave the subtractions and additions of get_next for the sequential cumulative sum
+        steps = np.empty(2 * len(values) + 1, dtype=float)
+        steps[0] = self.SMA
+        steps[1::2] = -(olds / self.period)
+        steps[2::2] = values / self.period
+        sma = np.cumsum(steps)[2::2]
+        self._push_many(values)
+        if len(sma):
+            self.SMA = sma[-1]
+        return sma
+
+    @classmethod
+    def from_history(cls, period: int, values: np.ndarray) -> 'iSMA':
+        ind = cls(period)
+        ind.update_many(values)
+        return ind
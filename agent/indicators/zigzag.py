@@ -1,31 +1,38 @@
 '''
 ZigZag indicator
+
+Batch scans (identify_initial_pivot, update_many) search the first threshold crossing with running min/max
+over chunks of doubling size, so the cost is O(len) in NumPy with a Python step per pivot only.
 '''
 
 import numpy as np
 
+from .kernels import NUMBA, zigzag_run
+
 
 PEAK = 1
 VALLEY = -1
 
 class iZigZag:
     def identify_initial_pivot(self, X: np.ndarray) -> int:
+        X = np.asarray(X, dtype=float)
         x_0 = X[0]
         max_x, min_x = x_0, x_0
-        max_t, min_t = 0, 0
-
-        for t in range(1, len(X)):
-            x_t = X[t]
-            if x_t / min_x >= self.up_thresh:
-                return VALLEY if min_t == 0 else PEAK
-            if x_t / max_x <= self.down_thresh:
-                return PEAK if max_t == 0 else VALLEY
-            if x_t > max_x:
-                max_x = x_t
-                max_t = t
-            if x_t < min_x:
-                min_x = x_t
-                min_t = t
+
+        for c in _chunks(X, 1):
+            # extremes before each value, a moved extreme means max_t/min_t != 0
+            prev_max = np.maximum.accumulate(np.concatenate(([max_x], c)))[:-1]
+            prev_min = np.minimum.accumulate(np.concatenate(([min_x], c)))[:-1]
+            up = c / prev_min >= self.up_thresh
+            down = c / prev_max <= self.down_thresh
+            hit = up | down
+            if hit.any():
+                t = np.argmax(hit)
+                if up[t]:
+                    return VALLEY if prev_min[t] == x_0 else PEAK
+                return PEAK if prev_max[t] == x_0 else VALLEY
+            max_x = max(max_x, c.max())
+            min_x = min(min_x, c.min())
 
         t_n = len(X)-1
         return VALLEY if x_0 < X[t_n] else PEAK
@@ -64,3 +71,56 @@ class iZigZag:
                 self.last_pivot_x = x
 
         return pivot
+
+    def update_many(self, values: np.ndarray) -> np.ndarray:
+        """
+        batch version of get_next, returns int8 pivots for every value and leaves the same state
+        """
+        X = np.asarray(values, dtype=float)
+        if NUMBA:
+            out, self.trend, self.last_pivot_x = zigzag_run(X, self.trend, float(self.last_pivot_x), self.up_thresh, self.down_thresh)
+            return out
+        out = np.zeros(len(X), dtype=np.int8)
+        t = 0
+        while t < len(X):
+            for c in _chunks(X, t):
+                # the last pivot value before each value of the chunk
+                if self.trend == -1:
+                    prev = np.minimum.accumulate(np.concatenate(([self.last_pivot_x], c)))
+                    hit = c / prev[:-1] >= self.up_thresh
+                else:
+                    prev = np.maximum.accumulate(np.concatenate(([self.last_pivot_x], c)))
+                    hit = c / prev[:-1] <= self.down_thresh
+                if hit.any():
+                    k = np.argmax(hit)
+                    out[t + k] = self.trend
+                    self.trend = PEAK if self.trend == -1 else VALLEY
+                    self.last_pivot_x = c[k]
+                    t += k + 1
+                    break
+                self.last_pivot_x = prev[-1]
+                t += len(c)
+        return out
+
+
+def _chunks(X: np.ndarray, start: int, size: int = 64):
+    """
+    consecutive chunks of X from start with doubling sizes
+    """
+    while start < len(X):
+        yield X[start:start + size]
+        start += size
+        size *= 2
+
+
+def zigzag_scan(x: np.ndarray, up_thresh: float, down_thresh: float) -> np.ndarray:
+    """
+    zigzag pivots of the whole series (e.g. for research and warmup).
+    pivots[0] is the initial pivot identified from x, the rest are the same int8 signals as get_next
+    of iZigZag(up_thresh, down_thresh, x) for each of x[1:].
+    """
+    ind = iZigZag(up_thresh, down_thresh, x)
+    pivots = np.empty(len(x), dtype=np.int8)
+    pivots[0] = -ind.trend
+    pivots[1:] = ind.update_many(x[1:])
+    return pivots
@@ -11,9 +11,10 @@ XAi = X(i) − X(i-Lag)
 
 import numpy as np
 from .ema import iEMA
+from .ring import RingWindow
 
 
-class iZLEMA:
+class iZLEMA(RingWindow):
     '''
     period = len(initial_values) // 2
     '''
@@ -21,13 +22,28 @@ class iZLEMA:
         ni = len(init_values)
         self.n = ni // 2
         self.lag = self.n // 2
-        self.wnd = np.copy(init_values[:self.lag])
+        super().__init__(self.lag)
+        self._fill(init_values[:self.lag])
         iva = np.zeros(ni, dtype=float)
         iva[self.lag:] = init_values[0]
         iva = [2 * init_values[i] - init_values[i - self.lag] for i in range(self.lag, ni)]
         self.iema = iEMA(iva)
 
     def get_next(self, v):
-        self.wnd = np.roll(self.wnd, -1, axis=0)
-        self.wnd[-1] = v
-        return self.iema.get_next(2 * v - self.wnd[0])
+        self._push(v)
+        return self.iema.get_next(2 * v - self.wnd[self.head])
+
+    def update_many(self, values: np.ndarray) -> np.ndarray:
+        """
+        batch version of get_next, returns ZLEMA for every value and leaves the same state
+        """
+        values = np.asarray(values, dtype=float)
+        lagged = self._history(values)[1:len(values) + 1]
+        self._push_many(values)
+        return self.iema.update_many(2 * values - lagged)
+
+    @classmethod
+    def from_history(cls, period: int, values: np.ndarray) -> 'iZLEMA':
+        ind = cls(values[:period * 2])
+        ind.update_many(values[period * 2:])
+        return ind
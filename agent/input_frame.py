@@ -3,11 +3,10 @@ from log import mplog
 import logging
 
 import numpy as np
-import copy
 
 import agent.agent_base as ab
 from agent.indicators.lsma import iLSMA
-from agent.rms import RMS
+from agent.rms import RMS, rms_norm_run
 
 
 # features indices
@@ -24,12 +23,26 @@ class InputFrame:
     def __init__(self, params: ab.AnalyzerParams):
         self.params = params
 
-        self.orig_ohlcv = self.prev_orig_ohlcv = None
         #todo:rm self.start_close_price_updated = self.start_close_price = None
-        self.input_frame = np.zeros((params.frame_size, FEATURES.NUM), dtype=np.float32)
+        # circular frame mirrored into two halves: each new row is written at head and head + frame_size,
+        # so input_frame[head:head + frame_size] is always the ordered frame (oldest first) without copying
+        self.frame_size = params.frame_size
+        self.input_frame = np.zeros((2 * self.frame_size, FEATURES.NUM), dtype=np.float32)
+        self.head = 0
+
+        # preallocated buffers of the per-bar pipeline
+        self.orig_ohlcv = np.zeros(FEATURES.NUM, dtype=np.float64)  # original ohlcv of the last timeframe
+        self.prev_orig_ohlcv = np.zeros(FEATURES.NUM, dtype=np.float64)  # and of the previous one, swapped on every bar
+        self.bars = 0
+        self.row = np.zeros(FEATURES.NUM, dtype=np.float32)  # new row of the frame
+        self.log_ohlcv = np.zeros(FEATURES.NUM, dtype=np.float64)
+        self.sign_ohlcv = np.zeros(FEATURES.NUM, dtype=np.float64)
 
         self.norm_eps = 1.0e-10
 
+        self.wu_buff = None
+        self.wu_pt = 0
+
         if self.params.smooth_period > 1:  # warmup smoothing MAs
             self.OMA = self.HMA = self.LMA = self.CMA = self.VMA = None
 
@@ -39,14 +52,16 @@ class InputFrame:
             self.norm_features_begin = FEATURES.OPEN
             self.norm_features_end = FEATURES.VOLUME + 1
             self.input_rms = RMS(epsilon=self.norm_eps, shape=(self.norm_features_end - self.norm_features_begin,))
+            self.norm_x = np.zeros(self.norm_features_end - self.norm_features_begin, dtype=np.float64)
+            self.norm_std = np.zeros_like(self.norm_x)
 
         # input differencing
         # if self.params.diff_input:
 
     def warmup(self, data: np.ndarray, wu_size: int):
-        self.wu_buff = np.zeros((wu_size, 5), dtype=np.float32)
-        self.wu_pt = 0
         if self.wu_pt < wu_size:  # accumulate buffer for indicators warmup
+            if self.wu_pt == 0:
+                self.wu_buff = np.zeros((wu_size, 5), dtype=np.float32)
             self.wu_buff[self.wu_pt] = data[1:-1]  # todo: use all elements?
             self.wu_pt += 1
             if self.wu_pt == wu_size:  # warmup indicators
@@ -59,57 +74,134 @@ class InputFrame:
                     self.LMA = iLSMA(self.wu_buff[:, FEATURES.LOW])
                     self.CMA = iLSMA(self.wu_buff[:, FEATURES.CLOSE])
                     self.VMA = iLSMA(self.wu_buff[:, FEATURES.VOLUME])
-                del self.wu_buff
+                self.wu_buff = None
         else:  # fill input frame
             self(data[1:-1])
             self.wu_pt += 1
 
+    @classmethod
+    def from_history(cls, params: ab.AnalyzerParams, wu_size: int, ohlcv: np.ndarray) -> 'InputFrame':
+        """
+        batch version of warmup for each row of the history ohlcv[bars, 5] (data[1:-1] of the warmup rows),
+        reaches the same frame and state. The log, smoothing and differencing are vectorized,
+        the normalization is a recursion over the rows and runs as a kernel (see agent.rms.rms_norm_run).
+        """
+        frame = cls(params)
+        ohlcv = np.asarray(ohlcv, dtype=np.float64)
+        for data in ohlcv[:wu_size]:  # the warmup buffer is small, it is accumulated as by the streaming path
+            frame.warmup(np.concatenate(([0.], data, [0.])), wu_size)
+        orig = ohlcv[wu_size:]
+        n = len(orig)
+        if n == 0:
+            return frame
+
+        # logarithmize ohlcv if specified
+        x = np.sign(orig) * np.log(np.abs(orig) + 1.0) if params.log_input else orig
+
+        # smooth prices and volumes if specified
+        rows = np.empty((n, FEATURES.NUM), dtype=np.float32)
+        if params.smooth_period > 1:
+            for k, ma in enumerate((frame.OMA, frame.HMA, frame.LMA, frame.CMA, frame.VMA)):
+                rows[:, k] = ma.update_many(x[:, k])
+        else:
+            rows[:, :FEATURES.VOLUME + 1] = x
+
+        # normalize if specified
+        if params.norm_input:
+            rms = frame.input_rms
+            rms.count = rms_norm_run(rows[:, frame.norm_features_begin:frame.norm_features_end], rms.mean, rms.var,
+                                     rms.count, frame.norm_eps, frame.norm_clip)
+
+        # differentiate if specified
+        if params.diff_input:
+            opens = rows[:, FEATURES.OPEN].copy()
+            rows[:, FEATURES.HIGH] = rows[:, FEATURES.HIGH] / opens - 1.0
+            rows[:, FEATURES.LOW] = rows[:, FEATURES.LOW] / opens - 1.0
+            rows[:, FEATURES.CLOSE] = rows[:, FEATURES.CLOSE] / opens - 1.0
+            prev_close = orig[:-1, FEATURES.CLOSE]
+            prev_volume = orig[:-1, FEATURES.VOLUME]
+            rows[1:, FEATURES.OPEN] = opens[1:] / prev_close - 1.0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rows[1:, FEATURES.VOLUME] = np.where(prev_volume > .0, rows[1:, FEATURES.VOLUME] / prev_volume - 1.0, 1.)
+            rows[0, FEATURES.OPEN] = rows[0, FEATURES.VOLUME] = .0
+
+        # put the last rows into the frame
+        k = np.arange(max(n - frame.frame_size, 0), n)
+        frame.input_frame[k % frame.frame_size] = rows[k]
+        frame.input_frame[k % frame.frame_size + frame.frame_size] = rows[k]
+        frame.head = n % frame.frame_size
+        frame.orig_ohlcv[:] = orig[-1]
+        if n > 1:
+            frame.prev_orig_ohlcv[:] = orig[-2]
+        frame.bars = n
+        frame.wu_pt += n
+        return frame
+
     def __call__(self, ohlcv: np.ndarray):
-        # shift input frame to the left
-        self.input_frame = np.roll(self.input_frame, -1, axis=0)
         # store original ohlcv for last timeframe
-        self.prev_orig_ohlcv = self.orig_ohlcv
-        self.orig_ohlcv = copy.deepcopy(ohlcv)
+        self.prev_orig_ohlcv, self.orig_ohlcv = self.orig_ohlcv, self.prev_orig_ohlcv
+        np.copyto(self.orig_ohlcv, ohlcv)
+        self.bars += 1
+        ohlcv = self.orig_ohlcv
+        row = self.row
 
         # logarithmize ohlcv if specified
         if self.params.log_input:
-            ohlcv = np.sign(self.orig_ohlcv) * np.log(np.abs(self.orig_ohlcv) + 1.0)
+            ohlcv = np.abs(self.orig_ohlcv, out=self.log_ohlcv)
+            ohlcv += 1.0
+            np.log(ohlcv, out=ohlcv)
+            ohlcv *= np.sign(self.orig_ohlcv, out=self.sign_ohlcv)
 
         # smooth prices and volumes if specified
         if self.params.smooth_period > 1:
-            self.input_frame[-1, FEATURES.OPEN] = self.OMA.get_next(ohlcv[FEATURES.OPEN])
-            self.input_frame[-1, FEATURES.HIGH] = self.HMA.get_next(ohlcv[FEATURES.HIGH])
-            self.input_frame[-1, FEATURES.LOW] = self.LMA.get_next(ohlcv[FEATURES.LOW])
-            self.input_frame[-1, FEATURES.CLOSE] = self.CMA.get_next(ohlcv[FEATURES.CLOSE])
-            self.input_frame[-1, FEATURES.VOLUME] = self.VMA.get_next(ohlcv[FEATURES.VOLUME])
+            row[FEATURES.OPEN] = self.OMA.get_next(ohlcv[FEATURES.OPEN])
+            row[FEATURES.HIGH] = self.HMA.get_next(ohlcv[FEATURES.HIGH])
+            row[FEATURES.LOW] = self.LMA.get_next(ohlcv[FEATURES.LOW])
+            row[FEATURES.CLOSE] = self.CMA.get_next(ohlcv[FEATURES.CLOSE])
+            row[FEATURES.VOLUME] = self.VMA.get_next(ohlcv[FEATURES.VOLUME])
         else:
-            self.input_frame[-1, :FEATURES.VOLUME + 1] = ohlcv
+            row[:FEATURES.VOLUME + 1] = ohlcv
 
         # normalize if specified
         if self.params.norm_input:
-            iframe_ohlcv = self.input_frame[-1, self.norm_features_begin:self.norm_features_end]
+            iframe_ohlcv = row[self.norm_features_begin:self.norm_features_end]
             self.input_rms.update_from_moments(iframe_ohlcv, 0., 1)
-            self.input_frame[-1, self.norm_features_begin:self.norm_features_end] =\
-                np.clip((iframe_ohlcv - self.input_rms.mean) / np.sqrt(self.input_rms.var + self.norm_eps), -self.norm_clip, self.norm_clip)
+            x = np.subtract(iframe_ohlcv, self.input_rms.mean, out=self.norm_x)
+            x /= np.sqrt(np.add(self.input_rms.var, self.norm_eps, out=self.norm_std), out=self.norm_std)
+            iframe_ohlcv[:] = np.clip(x, -self.norm_clip, self.norm_clip, out=x)
 
         # differentiate if specified
         if self.params.diff_input:
             # assert data[-1, FEATURES.OPEN] != .0, f'data[-1]: {str(data[-1])}'
-            self.input_frame[-1, FEATURES.HIGH] = self.input_frame[-1, FEATURES.HIGH] / self.input_frame[-1, FEATURES.OPEN] - 1.0
-            self.input_frame[-1, FEATURES.LOW] = self.input_frame[-1, FEATURES.LOW] / self.input_frame[-1, FEATURES.OPEN] - 1.0
-            self.input_frame[-1, FEATURES.CLOSE] = self.input_frame[-1, FEATURES.CLOSE] / self.input_frame[-1, FEATURES.OPEN] - 1.0
-            if self.prev_orig_ohlcv is not None:
-                self.input_frame[-1, FEATURES.OPEN] = self.input_frame[-1, FEATURES.OPEN] / self.prev_orig_ohlcv[
-                    FEATURES.CLOSE] - 1.0
-                self.input_frame[-1, FEATURES.VOLUME] = self.input_frame[-1, FEATURES.VOLUME] / self.prev_orig_ohlcv[
+            row[FEATURES.HIGH] = row[FEATURES.HIGH] / row[FEATURES.OPEN] - 1.0
+            row[FEATURES.LOW] = row[FEATURES.LOW] / row[FEATURES.OPEN] - 1.0
+            row[FEATURES.CLOSE] = row[FEATURES.CLOSE] / row[FEATURES.OPEN] - 1.0
+            if self.bars > 1:
+                row[FEATURES.OPEN] = row[FEATURES.OPEN] / self.prev_orig_ohlcv[FEATURES.CLOSE] - 1.0
+                row[FEATURES.VOLUME] = row[FEATURES.VOLUME] / self.prev_orig_ohlcv[
                     FEATURES.VOLUME] - 1.0 if self.prev_orig_ohlcv[FEATURES.VOLUME] > .0 else 1.
             else:  # do this only on init
-                self.input_frame[-1, FEATURES.OPEN] = .0
-                self.input_frame[-1, FEATURES.VOLUME] = .0
-
-    def data(self) -> np.ndarray:
-        return self.input_frame
+                row[FEATURES.OPEN] = .0
+                row[FEATURES.VOLUME] = .0
+
+        # push the row into the frame
+        self.input_frame[self.head] = row
+        self.input_frame[self.head + self.frame_size] = row
+        self.head += 1
+        if self.head == self.frame_size:
+            self.head = 0
+
+    def data(self, out: np.ndarray = None) -> np.ndarray:
+        """
+        ordered frame [frame_size, FEATURES.NUM] (oldest first):
+        a view valid until the next bar, or a copy into out if a preallocated buffer is given
+        """
+        frame = self.input_frame[self.head:self.head + self.frame_size]
+        if out is None:
+            return frame
+        np.copyto(out, frame)
+        return out
 
     def __del__(self):
         if self.input_frame is not None:
-            del self.input_frame
\ No newline at end of file
+            del self.input_frame
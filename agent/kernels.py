@@ -0,0 +1,28 @@
+'''
+Optional numba backend of the compiled kernels (agent.indicators.kernels, agent.rms)
+
+The kernels are plain Python functions of the batch loops, compiled by numba.njit when the backend is on.
+Per-bar scalar code is not compiled: a call of a compiled function costs more than the scalar step itself.
+• NUMBA is True when numba is installed and the environment variable TBX_NUMBA is not "0"
+• kernel.py_func is the Python version of a kernel with either backend (for parity tests)
+'''
+
+import os
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+NUMBA = numba is not None and os.environ.get("TBX_NUMBA", "1") != "0"
+
+
+def kernel(func):
+    """
+    numba.njit(func) when the backend is on, otherwise func itself
+    """
+    if NUMBA:
+        return numba.njit(cache=True)(func)
+    func.py_func = func
+    return func
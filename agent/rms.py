@@ -8,6 +8,8 @@ from sb3.RunningMeanStd
 from typing import Tuple
 import numpy as np
 
+from agent.kernels import kernel
+
 
 class RMS:
     def __init__(self, epsilon: float = 1e-4, shape: Tuple[int, ...] = ()):
@@ -57,3 +59,20 @@ class RMS:
         self.mean = new_mean
         self.var = new_var
         self.count = new_count
+
+
+@kernel
+def rms_norm_run(x, mean, var, count, eps, clip):
+    """
+    RMS.update_from_moments(x[i], 0., 1) followed by the clipped normalization of x[i] for each row of x in place,
+    mean and var are updated in place, returns the new count, see InputFrame.__call__ and InputFrame.from_history
+    """
+    for i in range(x.shape[0]):
+        tot_count = count + 1
+        for j in range(x.shape[1]):
+            delta = x[i, j] - mean[j]
+            mean[j] = mean[j] + delta * 1 / tot_count
+            var[j] = (var[j] * count + 0. + delta * delta * count * 1 / tot_count) / tot_count
+            x[i, j] = min(max((x[i, j] - mean[j]) / np.sqrt(var[j] + eps), -clip), clip)
+        count = 1 + count
+    return count
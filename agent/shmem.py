@@ -1,76 +1,208 @@
 '''
 Shared memory with single writer and multiple readers for market data feed
+
+Layout:
+• data segment TB{agent_id}: table[slots, 5] of the latest (partial) candles, rings[slots, 2 * depth, 5] of closed candles
+• meta segment TBMETA{agent_id}: slots count, depth, directory[slots, 2] of (timeframe, asset id) keys,
+  versions[slots], cursors[slots] (closed candles count, the per-stream sequence counters)
+The owner writes the directory once at creation, the readers map it into a dict key -> slot on attaching,
+so a lookup is an O(1) index without hash collisions.
+
+History mode (depth > 0): every stream keeps the last depth closed candles in a ring mirrored into two halves
+(each candle is written at cursor % depth and cursor % depth + depth), so the last k candles are always
+a contiguous slice, and a reader behind the cursor can catch up with the missed candles (since).
+A candle is written before the cursor is advanced, so the candles before the cursor are complete.
+The owner seeds the rings with the closed candles of the warmup history (extend), so the agent warms its analyzers
+from the shared memory (since) instead of receiving the history through the pipe.
+
+Notification: the writer advances the cursors of the streams with closed candles and rings ShMemNotifier once,
+the reader wakes up once and processes every stream whose cursor differs from the one it has seen.
+It requires history mode with depth > 1: the reader takes the closed candles from the ring (since), the latest slot may already
+hold the next partial candle when the reader wakes up.
+
+Every slot is guarded by a seqlock instead of a lock flag:
+• the writer increments the slot version before and after the write, so the version is odd while the slot is written
+• a reader takes the version, copies the slot and takes the version again,
+  the copy is consistent if both versions are equal and even, otherwise the read is retried
+Readers never block the writer and never write to the shared memory, so only the owner (the feed) may store and clear.
+The protocol relies on the x86-64 memory order (stores are not reordered with stores, loads with loads)
+and on atomic aligned int64 stores: Python has no explicit fences.
 '''
 
+import os
+import time
+
 import numpy as np
 import multiprocessing.shared_memory as shm
 
 class ShMemOHLCV:
     DATA_ITEM_SIZE = 5  # OHLCV values as float64
-    MIN_SIZE = 16
 
-    # specified size also means taking ownership
-    def __init__(self, agent_id: int, size: int = None):
+    # specified keys [(timeframe, asset id)] also mean taking ownership
+    def __init__(self, agent_id: int, keys: list[tuple[int, int]] = None, depth: int = 0):
+        """
+        depth: closed candles kept per stream (history mode), 0 = the latest candle only, set by the owner
+        """
         self.name = f"TB{agent_id}"
-        self.lock_name = f"TBLOCK{agent_id}"
+        self.meta_name = f"TBMETA{agent_id}"
         self.dtype = np.float64
-        self.is_owner = size is not None
+        self.is_owner = keys is not None
 
         try:
             # try to attach to existing shared memory
             self.shm = shm.SharedMemory(name=self.name)
-            self.lock_shm = shm.SharedMemory(name=self.lock_name)
-            self.size = self.shm.size // np.dtype(self.dtype).itemsize // self.DATA_ITEM_SIZE
+            self.meta_shm = shm.SharedMemory(name=self.meta_name)
+            self.size, self.depth = (int(v) for v in np.ndarray((2,), dtype=np.int64, buffer=self.meta_shm.buf))
         except FileNotFoundError:
-            assert size is not None, f"Shared memory {self.name} was not found, and size for creation is not specified."
-            self.size = max(size, self.MIN_SIZE)  # to prevent hashed index collisions
-            # create new shared memory and lock
-            self.shm = shm.SharedMemory(name=self.name, create=True, size=self.size * self.DATA_ITEM_SIZE * np.dtype(self.dtype).itemsize)
-            self.lock_shm = shm.SharedMemory(name=self.lock_name, create=True, size=8)  # 8-byte lock flag
-            np.ndarray((self.size, self.DATA_ITEM_SIZE), dtype=self.dtype, buffer=self.shm.buf)[:] = 0.  # zero out memory for new instance
-            np.ndarray((1,), dtype=np.int64, buffer=self.lock_shm.buf)[0] = 0  # reset lock
+            assert keys is not None, f"Shared memory {self.name} was not found, and keys for creation are not specified."
+            keys = list(dict.fromkeys(keys))  # unique keys in the given order
+            self.size = len(keys)
+            self.depth = depth
+            # create new shared memory and its meta data: slots count, depth, directory, versions and cursors
+            self.shm = shm.SharedMemory(name=self.name, create=True, size=max(self._data_size(), 1))
+            self.meta_shm = shm.SharedMemory(name=self.meta_name, create=True, size=(2 + 4 * self.size) * 8)
+            np.ndarray((self._data_size() // 8,), dtype=self.dtype, buffer=self.shm.buf)[:] = 0.  # zero out memory for new instance
+            np.ndarray((2 + 4 * self.size,), dtype=np.int64, buffer=self.meta_shm.buf)[:] = 0  # reset versions and cursors
+            np.ndarray((2,), dtype=np.int64, buffer=self.meta_shm.buf)[:] = self.size, self.depth
+            np.ndarray((self.size, 2), dtype=np.uint64, buffer=self.meta_shm.buf, offset=16)[:] = np.array(keys, dtype=np.uint64).reshape(-1, 2)
 
         # shared memory-backed arrays
         self.table = np.ndarray((self.size, self.DATA_ITEM_SIZE), dtype=self.dtype, buffer=self.shm.buf)
-        self.lock_flag = np.ndarray((1,), dtype=np.int64, buffer=self.lock_shm.buf)
+        self.rings = np.ndarray((self.size, 2 * self.depth, self.DATA_ITEM_SIZE), dtype=self.dtype, buffer=self.shm.buf,
+                                offset=self.table.nbytes)
+        self.directory = np.ndarray((self.size, 2), dtype=np.uint64, buffer=self.meta_shm.buf, offset=16)
+        self.seq = np.ndarray((self.size,), dtype=np.int64, buffer=self.meta_shm.buf, offset=(2 + 2 * self.size) * 8)
+        self.cursors = np.ndarray((self.size,), dtype=np.int64, buffer=self.meta_shm.buf, offset=(2 + 3 * self.size) * 8)
+        self.slots = {(tf, aid): i for i, (tf, aid) in enumerate(self.directory.tolist())}
 
-    def _hash(self, timeframe: int, asset_id: int) -> int:
-        return ((timeframe * 31) ^ (asset_id * 17)) % self.size
+    def _data_size(self) -> int:
+        return self.size * (1 + 2 * self.depth) * self.DATA_ITEM_SIZE * np.dtype(self.dtype).itemsize
 
-    def _acquire_lock(self):
-        while self.lock_flag[0] == 1:
-            pass
-        self.lock_flag[0] = 1
+    def has_keys(self, keys: list[tuple[int, int]]) -> bool:
+        return all(key in self.slots for key in keys)
 
-    def _release_lock(self):
-        self.lock_flag[0] = 0
+    def _slot(self, timeframe: int, asset_id: int) -> int:
+        try:
+            return self.slots[(timeframe, asset_id)]
+        except KeyError:
+            raise KeyError(f"No slot for timeframe {timeframe} and asset {asset_id} in shared memory {self.name}") from None
+
+    def _write(self, index: int, ohlcv):
+        self.seq[index] += 1  # odd: the write is in progress
+        self.table[index] = ohlcv
+        self.seq[index] += 1  # even: the slot is consistent
 
     def store(self, timeframe: int, asset_id: int, ohlcv: np.ndarray):
-        self._acquire_lock()
-        try:
-            index = self._hash(timeframe, asset_id)
-            self.table[index] = ohlcv
-        finally:
-            self._release_lock()
+        self._write(self._slot(timeframe, asset_id), ohlcv)
 
-    def read(self, timeframe: int, asset_id: int) -> np.ndarray:
-        index = self._hash(timeframe, asset_id)
-        return self.table[index]
+    def read(self, timeframe: int, asset_id: int, out: np.ndarray = None) -> np.ndarray:
+        """
+        consistent copy of the slot, into out if a preallocated buffer is given
+        """
+        index = self._slot(timeframe, asset_id)
+        if out is None:
+            out = np.empty(self.DATA_ITEM_SIZE, dtype=self.dtype)
+        while True:
+            v = self.seq[index]
+            if v & 1 == 0:
+                out[:] = self.table[index]
+                if self.seq[index] == v:
+                    return out
+            time.sleep(0)  # the writer is inside the slot, yield to it
 
     def clear(self, timeframe: int, asset_id: int):
-        self._acquire_lock()
-        try:
-            index = self._hash(timeframe, asset_id)
-            self.table[index] = 0.
-        finally:
-            self._release_lock()
+        self._write(self._slot(timeframe, asset_id), 0.)
+
+    def append(self, timeframe: int, asset_id: int, ohlcv: np.ndarray):
+        """
+        add a closed candle to the history of the stream and advance its cursor (writer only),
+        without history only the cursor is advanced
+        """
+        index = self._slot(timeframe, asset_id)
+        c = int(self.cursors[index])
+        if self.depth:
+            j = c % self.depth
+            self.rings[index, j] = ohlcv
+            self.rings[index, j + self.depth] = ohlcv
+        self.cursors[index] = c + 1  # advanced after the candle is written
+
+    def extend(self, timeframe: int, asset_id: int, ohlcv: np.ndarray):
+        """
+        add a block of closed candles [k, 5] to the history of the stream (writer only).
+        The cursor is advanced after every candle as by append, so a concurrent reader detects the overwritten candles.
+        """
+        for row in ohlcv:
+            self.append(timeframe, asset_id, row)
+
+    def cursor(self, timeframe: int, asset_id: int) -> int:
+        """
+        count of closed candles appended to the stream
+        """
+        return int(self.cursors[self._slot(timeframe, asset_id)])
+
+    def since(self, timeframe: int, asset_id: int, cursor: int) -> (np.ndarray, int):
+        """
+        copy of the closed candles appended after the cursor (at most depth - 1 last ones) and the new cursor
+        """
+        assert self.depth > 0, f"Shared memory {self.name} has no history"
+        index = self._slot(timeframe, asset_id)
+        while True:
+            c = int(self.cursors[index])
+            k = min(c - cursor, self.depth - 1)  # the writer may be writing the candle c over the candle c - depth
+            start = (c - k) % self.depth
+            bars = self.rings[index, start:start + k].copy()
+            if int(self.cursors[index]) == c:  # no candles were overwritten while copying
+                return bars, c
 
     def cleanup(self):
         self.shm.close()
-        self.lock_shm.close()
+        self.meta_shm.close()
         if self.is_owner:
             try:
                 self.shm.unlink()
-                self.lock_shm.unlink()
+                self.meta_shm.unlink()
             except FileNotFoundError:
                 pass  # another process may have already unlinked it
+
+
+class ShMemNotifier:
+    """
+    Wakeup of the reader process on new closed candles in the shared memory:
+    an eventfd on Linux, a non-blocking pipe elsewhere. It must be created before the reader process is forked.
+    Wakeups are coalesced, any count of notify() before the reader wakes up gives a single wakeup,
+    the reader finds the advanced streams by their cursors. fileno() makes it waitable by multiprocessing.connection.wait.
+    """
+    def __init__(self):
+        if hasattr(os, "eventfd"):
+            self.rfd = self.wfd = os.eventfd(0, os.EFD_NONBLOCK)
+        else:
+            self.rfd, self.wfd = os.pipe()
+            os.set_blocking(self.rfd, False)
+            os.set_blocking(self.wfd, False)
+
+    def fileno(self) -> int:
+        return self.rfd
+
+    def notify(self):
+        try:
+            if self.rfd == self.wfd:
+                os.eventfd_write(self.wfd, 1)
+            else:
+                os.write(self.wfd, b"\0")
+        except BlockingIOError:
+            pass  # the pipe is full, a wakeup is pending anyway
+
+    def clear(self):
+        try:
+            if self.rfd == self.wfd:
+                os.eventfd_read(self.rfd)  # resets the counter
+            else:
+                while os.read(self.rfd, 4096):
+                    pass
+        except BlockingIOError:
+            pass  # nothing pending
+
+    def close(self):
+        os.close(self.rfd)
+        if self.wfd != self.rfd:
+            os.close(self.wfd)
@@ -0,0 +1,75 @@
+import numpy as np
+from contextlib import contextmanager
+
+from agent.indicators import ema, hma, kama, kernels, zigzag
+
+
+'''
+Parity of the compiled (numba) and the pure NumPy backends of the batch updates of the indicators.
+Without numba the kernels run as Python functions, so the test still checks the kernel code.
+get_next has no compiled path, the first part of each series runs through it to check the state it leaves.
+Run: python -m agent.tests.indicators_backend_test
+'''
+
+MODULES = (ema, hma, kama, zigzag)  # the modules with compiled batch updates
+N = 5000
+
+rng = np.random.default_rng(7)
+close = 100 * np.exp(np.cumsum(rng.normal(0, .01, N)))
+high = close * (1 + np.abs(rng.normal(0, .003, N)))
+low = close * (1 - np.abs(rng.normal(0, .003, N)))
+
+
+@contextmanager
+def backend(compiled: bool):
+    for m in MODULES:
+        m.NUMBA = compiled
+    try:
+        yield
+    finally:
+        for m in MODULES:
+            m.NUMBA = kernels.NUMBA
+
+
+def run(make, *series, split: int = N // 2):
+    """
+    outputs of get_next over the first part and update_many over the rest with both backends
+    """
+    outs = []
+    for compiled in (False, True):
+        with backend(compiled):
+            ind = make()
+            first = [ind.get_next(*v) for v in zip(*(s[:split] for s in series))]
+            rest = ind.update_many(*(s[split:] for s in series))
+            outs.append(np.concatenate((np.asarray(first, dtype=float), np.asarray(rest, dtype=float))))
+    return outs
+
+
+def check(name: str, outs):
+    numpy_out, compiled_out = outs
+    assert np.array_equal(numpy_out, compiled_out), f"{name}: backends mismatch"
+    print(f"{name}: ok")
+
+
+def test_ema():
+    check("iEMA", run(lambda: ema.iEMA(close[:40]), close))
+
+
+def test_hma():
+    check("iHMA", run(lambda: hma.iHMA(20, close[:40]), close))
+
+
+def test_kama():
+    check("iKAMA", run(lambda: kama.iKAMA(2 / 3, 2 / 31, close[:10]), close))
+
+
+def test_zigzag():
+    check("iZigZag", run(lambda: zigzag.iZigZag(.01, -.01, close[:50]), close))
+
+
+if __name__ == "__main__":
+    print(f"numba backend: {'on' if kernels.NUMBA else 'off'}")
+    test_ema()
+    test_hma()
+    test_kama()
+    test_zigzag()
@@ -0,0 +1,291 @@
+'''
+Micro-benchmarks of the indicators, InputFrame and RMS over synthetic OHLCV
+
+For every case:
+• update_ns - per-update latency of get_next (or the streaming call), best of the repeats, ns per bar
+• batch_kbars_s - throughput of the batch call (update_many, scans), best of the repeats, thousands of bars per second
+
+Results are written as JSON and can be compared with the results of another commit:
+    python -m agent.tests.indicators_bench --out bench_base.json
+    python -m agent.tests.indicators_bench --out bench_new.json --compare bench_base.json --threshold 0.1
+The comparison prints the relative changes and exits with code 1 if any metric is worse than the threshold,
+if a case of the base fails to run now, or if it is missing from the new run (unless excluded by --only).
+A case that can not run in the environment (e.g. a missing dependency) is skipped explicitly with the reason,
+it is reported but does not fail the comparison.
+
+With numba the cases of the compiled kernels (BACKEND_CASES) also run with the pure backend,
+and the run exits with code 1 if the compiled backend is slower than the pure one by more than the threshold.
+'''
+
+import argparse
+import importlib.util
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from agent.indicators import kernels
+from agent.indicators.atr import iATR
+from agent.indicators.ema import iEMA
+from agent.indicators.engine import vATR, vEMA, vFractals, vHMA, vKAMA, vLSMA, vSMA, vZLEMA
+from agent.indicators.fractals import iFractals, fractals_scan
+from agent.indicators.hma import iHMA
+from agent.indicators.kama import iKAMA, kama_series
+from agent.indicators.levels import iLevels
+from agent.indicators.lsma import iLSMA, lsma_series
+from agent.indicators.sma import iSMA
+from agent.indicators.x3ma import x3ma
+from agent.indicators.zigzag import iZigZag, zigzag_scan
+from agent.indicators.zlema import iZLEMA
+from agent.rms import RMS
+from agent.tests.indicators_backend_test import backend
+
+
+PERIOD = 20
+SERIES = 16  # series count for the multi-series engine
+BACKEND_CASES = ("iEMA", "iHMA", "iKAMA", "iZigZag", "kama_series", "zigzag_scan")  # the cases with compiled kernels
+
+
+class SkipCase(Exception):
+    """
+    raised by the setup of a case that can not run in the environment, the message is the reason
+    """
+
+
+def gen_ohlcv(bars: int, seed: int = 1) -> np.ndarray:
+    """
+    synthetic OHLCV [bars, 5] of a random walk
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, .002, bars)))
+    open_ = np.concatenate(([100.], close[:-1]))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, .001, bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, .001, bars)))
+    volume = rng.lognormal(3, 1, bars)
+    return np.stack((open_, high, low, close, volume), axis=1)
+
+
+def input_frame_case(ohlcv: np.ndarray):
+    if importlib.util.find_spec("torch") is None:
+        raise SkipCase("torch is not installed")
+    from agent.agent_base import AnalyzerParams
+    from agent.input_frame import InputFrame
+    params = AnalyzerParams.parse_values({"asset": "BTCUSDT", "timeframe": 1, "frame_size": 8, "smooth_period": 0,
+                                          "log_input": 1, "diff_input": 1, "norm_input": 1})
+    return InputFrame(params), lambda frame: frame, [(row,) for row in ohlcv.astype(np.float32)], None
+
+
+def cases(ohlcv: np.ndarray) -> dict:
+    """
+    name -> setup() returning (indicator, step(indicator), step args per bar, batch(indicator) or None)
+    """
+    h, l, c = (ohlcv[:, i] for i in (1, 2, 3))
+    hl = list(zip(h.tolist(), l.tolist()))
+    hlc = list(zip(h.tolist(), l.tolist(), c.tolist()))
+    cs = [(x,) for x in c.tolist()]
+    cn = np.tile(c, (SERIES, 1))  # [N, bars]
+    cols = [(col,) for col in cn.T]
+    hl_cols = [(col * 1.001, col * .999) for col in cn.T]
+    hlc_cols = [(col * 1.001, col * .999, col) for col in cn.T]
+    f32 = c.astype(np.float32)
+    x3 = [(1, np.float32(.01), s, m, f) for s, m, f in zip(f32, f32, f32)]
+    moments = [(row, 0., 1) for row in ohlcv]
+    return {
+        "iSMA": lambda: (iSMA(PERIOD), lambda i: i.get_next, cs, lambda i: i.update_many(c)),
+        "iEMA": lambda: (iEMA(c[:PERIOD * 2]), lambda i: i.get_next, cs, lambda i: i.update_many(c)),
+        "iHMA": lambda: (iHMA(PERIOD, c[:PERIOD * 2]), lambda i: i.get_next, cs, lambda i: i.update_many(c)),
+        "iZLEMA": lambda: (iZLEMA(c[:PERIOD * 2]), lambda i: i.get_next, cs, lambda i: i.update_many(c)),
+        "iLSMA": lambda: (iLSMA(c[:PERIOD]), lambda i: i.get_next, cs, lambda i: i.update_many(c)),
+        "iKAMA": lambda: (iKAMA(2 / 3, 2 / 31, c[:PERIOD]), lambda i: i.get_next, cs, lambda i: i.update_many(c)),
+        "iATR": lambda: (iATR(PERIOD), lambda i: i.get_next, hlc, lambda i: i.update_many(h, l, c)),
+        "iFractals": lambda: (iFractals(5, .0002), lambda i: i.get_next, hl, lambda i: i.update_many(h, l)),
+        "iZigZag": lambda: (iZigZag(.01, -.01, c[:PERIOD]), lambda i: i.get_next, cs, lambda i: i.update_many(c)),
+        "iLevels": lambda: (iLevels(np.stack((h[:PERIOD], l[:PERIOD]), axis=1), 5, .0002, .002, 2, 1000),
+                            lambda i: i.get_next, hl, lambda i: i.update_many(h, l)),
+        "x3ma": lambda: (None, lambda _: x3ma, x3, None),
+        "fractals_scan": lambda: (None, None, None, lambda _: fractals_scan(h, l, 5, .0002)),
+        "zigzag_scan": lambda: (None, None, None, lambda _: zigzag_scan(c, .01, -.01)),
+        "lsma_series": lambda: (None, None, None, lambda _: lsma_series(c, PERIOD)),
+        "kama_series": lambda: (None, None, None, lambda _: kama_series(c, 2 / 3, 2 / 31, PERIOD)),
+        "vSMA": lambda: (vSMA(SERIES, PERIOD), lambda i: i.update, cols, None),
+        "vEMA": lambda: (vEMA(cn[:, :PERIOD * 2]), lambda i: i.update, cols, None),
+        "vHMA": lambda: (vHMA(PERIOD, cn[:, :PERIOD * 2]), lambda i: i.update, cols, None),
+        "vZLEMA": lambda: (vZLEMA(cn[:, :PERIOD * 2]), lambda i: i.update, cols, None),
+        "vLSMA": lambda: (vLSMA(cn[:, :PERIOD]), lambda i: i.update, cols, None),
+        "vKAMA": lambda: (vKAMA(2 / 3, 2 / 31, cn[:, :PERIOD]), lambda i: i.update, cols, None),
+        "vATR": lambda: (vATR(SERIES, PERIOD), lambda i: i.update, hlc_cols, None),
+        "vFractals": lambda: (vFractals(SERIES, 5, .0002), lambda i: i.update, hl_cols, None),
+        "RMS": lambda: (RMS(shape=(5,)), lambda i: i.update_from_moments, moments, lambda i: i.update(ohlcv)),
+        "InputFrame": lambda: input_frame_case(ohlcv),
+    }
+
+
+def measure(setup, repeat: int, bars: int) -> dict:
+    update_ns = batch_kbars_s = None
+    for _ in range(repeat):
+        ind, step, args, batch = setup()
+        if step is not None:
+            fn = step(ind)
+            t = time.perf_counter_ns()
+            for a in args:
+                fn(*a)
+            ns = (time.perf_counter_ns() - t) / len(args)
+            update_ns = ns if update_ns is None else min(update_ns, ns)
+        if batch is not None:
+            ind = setup()[0]
+            t = time.perf_counter_ns()
+            batch(ind)
+            kbs = bars / (time.perf_counter_ns() - t) * 1e6
+            batch_kbars_s = kbs if batch_kbars_s is None else max(batch_kbars_s, kbs)
+    return {"update_ns": update_ns, "batch_kbars_s": batch_kbars_s}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_backends(setups: dict, repeat: int, bars: int, only: list[str] | None) -> dict:
+    """
+    the cases of the compiled kernels measured with the pure backend and with the compiled one
+    """
+    results = {}
+    for name in BACKEND_CASES:
+        if only and name not in only:
+            continue
+        results[name] = {}
+        for compiled in (False, True):
+            with backend(compiled):
+                results[name]["compiled" if compiled else "pure"] = measure(setups[name], repeat, bars)
+        print(f"{name:14} pure     {fmt(results[name]['pure'])}")
+        print(f"{'':14} compiled {fmt(results[name]['compiled'])}")
+    return results
+
+
+def run(bars: int, repeat: int, only: list[str] | None) -> dict:
+    ohlcv = gen_ohlcv(bars)
+    setups = cases(ohlcv)
+    results = {}
+    for name, setup in setups.items():
+        if only and name not in only:
+            continue
+        try:
+            results[name] = measure(setup, repeat, bars)
+        except SkipCase as e:
+            results[name] = {"skipped": str(e)}
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+        print(f"{name:14} {fmt(results[name])}")
+    res = {
+        "meta": {"commit": git_commit(), "time": int(time.time()), "bars": bars, "repeat": repeat,
+                 "python": platform.python_version(), "numpy": np.__version__, "numba": kernels.NUMBA},
+        "results": results,
+    }
+    if kernels.NUMBA:  # without numba the kernels run as Python functions, there is nothing to compare
+        print("\nbackends:")
+        res["backends"] = run_backends(setups, repeat, bars, only)
+    return res
+
+
+def fmt(r: dict) -> str:
+    if "error" in r:
+        return f"error: {r['error']}"
+    if "skipped" in r:
+        return f"skipped: {r['skipped']}"
+    update = f"{r['update_ns']:10.0f} ns/update" if r["update_ns"] is not None else " " * 20
+    batch = f"{r['batch_kbars_s']:10.0f} kbars/s" if r["batch_kbars_s"] is not None else ""
+    return f"{update}  {batch}"
+
+
+def compare(new: dict, base: dict, threshold: float, only: list[str] | None = None) -> bool:
+    """
+    print relative changes of the metrics (positive = slower), returns True if none is worse than the threshold
+    and every case measured in the base is measured in the new run (or skipped there)
+    """
+    ok = True
+    print(f"\ncompared with {base['meta'].get('commit')} (threshold {threshold:.0%}):")
+    for name, b in base["results"].items():
+        if name not in new["results"] and not (only and name not in only):
+            ok &= "error" in b or "skipped" in b
+            print(f"{name:14} MISSING")
+    for name, r in new["results"].items():
+        b = base["results"].get(name)
+        if b is None or "error" in b or "skipped" in b:
+            continue
+        if "error" in r:
+            ok = False
+            print(f"{name:14} ERROR  {r['error']}")
+            continue
+        if "skipped" in r:
+            print(f"{name:14} SKIPPED  {r['skipped']}")
+            continue
+        ok &= report(name, changes(r, b), threshold)
+    return ok
+
+
+def changes(r: dict, b: dict) -> list[tuple[str, float]]:
+    """
+    relative changes of the metrics of r against b (positive = slower)
+    """
+    out = []
+    if r["update_ns"] is not None and b.get("update_ns"):
+        out.append(("update", r["update_ns"] / b["update_ns"] - 1.))
+    if r["batch_kbars_s"] is not None and b.get("batch_kbars_s"):
+        out.append(("batch", b["batch_kbars_s"] / r["batch_kbars_s"] - 1.))
+    return out
+
+
+def report(name: str, metric_changes: list[tuple[str, float]], threshold: float) -> bool:
+    """
+    print the changes, returns True if none is worse than the threshold
+    """
+    ok = True
+    for metric, change in metric_changes:
+        worse = change > threshold
+        ok &= not worse
+        print(f"{name:14} {metric:6} {change:+7.1%}{'  REGRESSION' if worse else ''}")
+    return ok
+
+
+def compare_backends(backends: dict, threshold: float) -> bool:
+    """
+    print relative changes of the compiled backend against the pure one (positive = slower),
+    returns True if the compiled backend is nowhere slower than the threshold
+    """
+    print(f"\ncompiled against pure backend (threshold {threshold:.0%}):")
+    ok = True
+    for name, r in backends.items():
+        ok &= report(name, changes(r["compiled"], r["pure"]), threshold)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="indicators micro-benchmarks")
+    parser.add_argument("--bars", type=int, default=20000, help="synthetic bars count")
+    parser.add_argument("--repeat", type=int, default=5, help="repeats of each measurement, the best one is kept")
+    parser.add_argument("--only", nargs="*", help="case names to run")
+    parser.add_argument("--out", help="JSON file for the results")
+    parser.add_argument("--compare", help="JSON results of the base commit")
+    parser.add_argument("--threshold", type=float, default=.1, help="relative slowdown to report as a regression")
+    args = parser.parse_args()
+
+    res = run(args.bars, args.repeat, args.only)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(res, f, indent=2)
+    ok = "backends" not in res or compare_backends(res["backends"], args.threshold)
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        ok &= compare(res, base, args.threshold, args.only)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import numpy as np
+from collections import deque
+
+from agent.indicators.atr import iATR
+from agent.indicators.ema import iEMA
+from agent.indicators.engine import vATR, vEMA, vFractals, vHMA, vKAMA, vLSMA, vSMA, vZLEMA
+from agent.indicators.fractals import iFractals, fractals_scan
+from agent.indicators.hma import iHMA
+from agent.indicators.kama import iKAMA, kama_series
+from agent.indicators.levels import iLevels
+from agent.indicators.lsma import iLSMA, lsma_series
+from agent.indicators.ring import RingWindow
+from agent.indicators.sma import iSMA
+from agent.indicators.zigzag import PEAK, VALLEY, iZigZag, zigzag_scan
+from agent.indicators.zlema import iZLEMA
+from agent.tests.indicators_backend_test import backend
+
+
+'''
+Parity of the batch updates (update_many, from_history, series) and the streaming get_next of the indicators:
+the outputs and the internal state must be bit for bit the same for any split of the series into batches.
+Every case runs with both backends (see indicators_backend_test).
+The whole-array scans must give the same signals as the streaming indicators.
+Every series of the multi-series engine must give the same values as the corresponding single-series indicator.
+Run: python -m agent.tests.indicators_test
+'''
+
+N = 3000
+
+rng = np.random.default_rng(11)
+close = 100 * np.exp(np.cumsum(rng.normal(0, .01, N)))
+high = close * (1 + np.abs(rng.normal(0, .003, N)))
+low = close * (1 - np.abs(rng.normal(0, .003, N)))
+
+# parallel series for the engine [SERIES, N]
+SERIES = 8
+closes = 100 * np.exp(np.cumsum(rng.normal(0, .01, (SERIES, N)), axis=1))
+highs = closes * (1 + np.abs(rng.normal(0, .003, (SERIES, N))))
+lows = closes * (1 - np.abs(rng.normal(0, .003, (SERIES, N))))
+
+# split points of the series into update_many calls
+SPLITS = (
+    [],  # the whole series in one call
+    [1, 2, 3],  # single values at the start
+    [17, 17, 500, 501, 2048],  # an empty batch, batches across many ring wraps
+    list(range(64, N, 64)),
+    list(range(97, N, 97)),
+)
+
+
+SCRATCH = {"xy"}  # preallocated buffers, not a part of the state
+
+
+def state(obj, prefix: str = "") -> dict:
+    """
+    flat attributes of an indicator and its nested indicators
+    """
+    out = {}
+    for k, v in vars(obj).items():
+        if k in SCRATCH:
+            continue
+        if isinstance(v, (RingWindow, iFractals, iZigZag)):
+            out.update(state(v, f"{prefix}{k}."))
+        elif isinstance(v, deque):
+            out[prefix + k] = list(v)
+        else:
+            out[prefix + k] = v
+    if isinstance(obj, iLevels):  # only the live parts of the stores
+        out[prefix + "pts"] = obj.pts[:obj.n_pts]
+        out[prefix + "lv"] = obj.lv[:obj.n_lv]
+    return out
+
+
+def check_state(name: str, a, b):
+    sa, sb = state(a), state(b)
+    assert sa.keys() == sb.keys(), f"{name}: attributes mismatch"
+    for k in sa:
+        assert np.array_equal(np.asarray(sa[k]), np.asarray(sb[k])), f"{name}: state {k} mismatch"
+
+
+def check_batches(name: str, make, *series, outputs: bool = True):
+    """
+    get_next over the series against update_many over its batches for every split and backend
+    """
+    for compiled in (False, True):
+        with backend(compiled):
+            ref = make()
+            ref_out = [ref.get_next(*v) for v in zip(*series)]
+            for split in SPLITS:
+                ind = make()
+                out = [ind.update_many(*batch) for batch in zip(*(np.split(s, split) for s in series))]
+                check_state(f"{name} {split[:3]}", ref, ind)
+                if outputs:
+                    assert np.array_equal(np.concatenate(out), ref_out), f"{name} {split[:3]}: outputs mismatch"
+                else:  # the result of the last batch only
+                    assert np.array_equal(out[-1], ref_out[-1]), f"{name} {split[:3]}: outputs mismatch"
+    print(f"{name} update_many: ok")
+
+
+def check_history(name: str, ind, make, *series):
+    """
+    from_history against the constructor from the initial values followed by get_next over the rest
+    """
+    ref = make()
+    for v in zip(*series):
+        ref.get_next(*v)
+    check_state(name, ref, ind)
+    print(f"{name} from_history: ok")
+
+
+def test_sma():
+    check_batches("iSMA", lambda: iSMA(20), close)
+    check_history("iSMA", iSMA.from_history(20, close), lambda: iSMA(20), close)
+
+
+def test_ema():
+    check_batches("iEMA", lambda: iEMA(close[:40]), close)
+    check_history("iEMA", iEMA.from_history(20, close), lambda: iEMA(close[:40]), close[40:])
+
+
+def test_hma():
+    check_batches("iHMA", lambda: iHMA(20, close[:40]), close)
+    check_history("iHMA", iHMA.from_history(20, close), lambda: iHMA(20, close[:40]), close[40:])
+
+
+def test_zlema():
+    check_batches("iZLEMA", lambda: iZLEMA(close[:40]), close)
+    check_history("iZLEMA", iZLEMA.from_history(20, close), lambda: iZLEMA(close[:40]), close[40:])
+
+
+def test_lsma():
+    check_batches("iLSMA", lambda: iLSMA(close[:25]), close)
+    check_history("iLSMA", iLSMA.from_history(25, close), lambda: iLSMA(close[:25]), close[25:])
+    ref = iLSMA(close[:25])
+    # the series has no running sums, so it matches the exact sums of the windows, not bit for bit
+    assert np.allclose(lsma_series(close, 25)[1:], [ref.get_next(v) for v in close[25:]], rtol=1e-12), "lsma_series: outputs mismatch"
+    print("lsma_series: ok")
+
+
+def test_kama():
+    check_batches("iKAMA", lambda: iKAMA(2 / 3, 2 / 31, close[:10]), close)
+    check_history("iKAMA", iKAMA.from_history(2 / 3, 2 / 31, 10, close), lambda: iKAMA(2 / 3, 2 / 31, close[:10]), close[10:])
+    ref = iKAMA(2 / 3, 2 / 31, close[:10])
+    expected = [ref.KAMAprev] + [ref.get_next(v) for v in close[10:]]
+    assert np.array_equal(kama_series(close, 2 / 3, 2 / 31, 10), expected), "kama_series: outputs mismatch"
+    print("kama_series: ok")
+
+
+def test_atr():
+    check_batches("iATR", lambda: iATR(14), high, low, close)
+    check_history("iATR", iATR.from_history(14, high, low, close), lambda: iATR(14), high, low, close)
+
+
+def test_fractals():
+    check_batches("iFractals", lambda: iFractals(5, .001), high, low)
+    check_history("iFractals", iFractals.from_history(5, .001, high, low), lambda: iFractals(5, .001), high, low)
+
+
+def test_zigzag():
+    check_batches("iZigZag", lambda: iZigZag(.01, -.01, close[:50]), close)
+
+
+def test_levels():
+    hl = np.stack((high, low), axis=1)
+    for lifetime, max_points in ((0, 1000), (300, 1000), (0, 50)):
+        name = f"iLevels lifetime {lifetime} max points {max_points}"
+        make = lambda: iLevels(hl[:20], 5, .001, .002, 1, lifetime, max_points)
+        check_batches(name, make, high[20:], low[20:], outputs=False)
+        ind = iLevels.from_history(20, 5, .001, .002, 1, high, low, lifetime, max_points)
+        check_history(name, ind, make, high[20:], low[20:])
+        assert ind.n_pts <= max_points, f"{name}: points store is not bounded"
+    # the output of get_next, update_many and levels() is a float32 copy, an empty one has shape (0,)
+    ind = iLevels(hl[:20], 5, .001, .002, 1000)
+    assert ind.get_next(high[20], low[20]).shape == ind.levels().shape == (0,), "iLevels: empty levels shape mismatch"
+    levels = ind.update_many(high[21:], low[21:])
+    assert levels.dtype == np.float32 and not np.shares_memory(levels, ind.lv), "iLevels: levels are not a float32 copy"
+    assert np.array_equal(ind.levels(), levels) and ind.levels().dtype == np.float32, "iLevels: levels() mismatch"
+    print("iLevels output: ok")
+
+
+def initial_pivot(X: np.ndarray, up_thresh: float, down_thresh: float) -> int:
+    """
+    reference per-value search of the initial pivot, see iZigZag.identify_initial_pivot
+    """
+    up_thresh += 1.
+    down_thresh += 1.
+    x_0 = X[0]
+    max_x, min_x = x_0, x_0
+    max_t, min_t = 0, 0
+    for t in range(1, len(X)):
+        x_t = X[t]
+        if x_t / min_x >= up_thresh:
+            return VALLEY if min_t == 0 else PEAK
+        if x_t / max_x <= down_thresh:
+            return PEAK if max_t == 0 else VALLEY
+        if x_t > max_x:
+            max_x, max_t = x_t, t
+        if x_t < min_x:
+            min_x, min_t = x_t, t
+    return VALLEY if x_0 < X[-1] else PEAK
+
+
+def test_fractals_scan():
+    for period, tolerance in ((3, 0.), (5, .001), (9, .0005)):
+        ind = iFractals(period, tolerance)
+        expected = [ind.get_next(h, l) for h, l in zip(high, low)]
+        assert np.array_equal(fractals_scan(high, low, period, tolerance), expected), f"fractals_scan {period}: signals mismatch"
+    print("fractals_scan: ok")
+
+
+def test_zigzag_scan():
+    for compiled in (False, True):
+        with backend(compiled):
+            for thresh in (.005, .05, .2, 10.):  # the last one is never crossed
+                ind = iZigZag(thresh, -thresh, close)
+                expected = [ind.get_next(x) for x in close[1:]]
+                pivots = zigzag_scan(close, thresh, -thresh)
+                assert pivots[0] == initial_pivot(close, thresh, -thresh), f"zigzag_scan {thresh}: initial pivot mismatch"
+                assert np.array_equal(pivots[1:], expected), f"zigzag_scan {thresh}: pivots mismatch"
+    # the first crossing at the edges of the doubling chunks (1, 65, 193, 449...) in both directions after a moved extreme
+    flat = 100 + rng.normal(0, .01, 1000)
+    for pos in (1, 2, 64, 65, 66, 192, 193, 448, 449, 999):
+        for jump in (1.02, .98):
+            x = flat.copy()
+            x[pos] *= jump
+            assert zigzag_scan(x, .01, -.01)[0] == initial_pivot(x, .01, -.01), f"zigzag_scan: initial pivot at {pos} mismatch"
+    print("zigzag_scan: ok")
+
+
+def check_engine(name: str, engine, make, *series):
+    """
+    engine.update over the columns of series [SERIES, N] against get_next of a single-series indicator per series
+    """
+    out = np.array([np.array(engine.update(*v)) for v in zip(*(s.T for s in series))])
+    for i in range(SERIES):
+        ind = make(i)
+        expected = [ind.get_next(*v) for v in zip(*(s[i] for s in series))]
+        assert np.array_equal(out[:, i], expected), f"{name}: series {i} mismatch"
+    print(f"{name}: ok")
+
+
+def test_engine():
+    check_engine("vSMA", vSMA(SERIES, 20), lambda i: iSMA(20), closes)
+    check_engine("vEMA", vEMA(closes[:, :40]), lambda i: iEMA(closes[i, :40]), closes)
+    check_engine("vHMA", vHMA(20, closes[:, :40]), lambda i: iHMA(20, closes[i, :40]), closes)
+    check_engine("vZLEMA", vZLEMA(closes[:, :40]), lambda i: iZLEMA(closes[i, :40]), closes)
+    check_engine("vATR", vATR(SERIES, 14), lambda i: iATR(14), highs, lows, closes)
+    check_engine("vLSMA", vLSMA(closes[:, :25]), lambda i: iLSMA(closes[i, :25]), closes)
+    check_engine("vKAMA", vKAMA(2 / 3, 2 / 31, closes[:, :10]), lambda i: iKAMA(2 / 3, 2 / 31, closes[i, :10]), closes)
+    check_engine("vFractals", vFractals(SERIES, 5, .001), lambda i: iFractals(5, .001), highs, lows)
+
+
+if __name__ == "__main__":
+    test_sma()
+    test_ema()
+    test_hma()
+    test_zlema()
+    test_lsma()
+    test_kama()
+    test_atr()
+    test_fractals()
+    test_zigzag()
+    test_levels()
+    test_fractals_scan()
+    test_zigzag_scan()
+    test_engine()
@@ -0,0 +1,71 @@
+import numpy as np
+
+from connectors.helpers import gen_agent_id
+from agent.shmem import ShMemOHLCV
+
+
+'''
+Warmup from the shared memory: the owner seeds the rings with the closed candles of the history (extend),
+a reader attached in another place takes the last candles of every stream (since) as the agent does on warmup.
+Run: python -m agent.tests.shmem_history_test
+'''
+
+AGENT_ID = gen_agent_id("History_Test_Agent")
+SLOTS = [(1, 11), (5, 11), (15, 22)]  # (timeframe, asset id)
+DEPTH = 64
+
+
+def candles(k: int, start: float) -> np.ndarray:
+    """
+    k candles [k, 5] with distinct values
+    """
+    return start + np.arange(k * ShMemOHLCV.DATA_ITEM_SIZE, dtype=float).reshape(k, ShMemOHLCV.DATA_ITEM_SIZE)
+
+
+def warmup(shmem: ShMemOHLCV, slot: (int, int), k: int) -> np.ndarray:
+    bars, cursor = shmem.since(*slot, shmem.cursor(*slot) - k)
+    assert cursor == shmem.cursor(*slot)
+    return bars
+
+
+def test_warmup():
+    owner = ShMemOHLCV(AGENT_ID, SLOTS, DEPTH)
+    try:
+        reader = ShMemOHLCV(AGENT_ID)
+        for i, slot in enumerate(SLOTS):
+            history = candles(10 + i, 1000. * i)
+            owner.extend(*slot, history)
+            assert reader.cursor(*slot) == len(history)
+            assert np.array_equal(warmup(reader, slot, len(history)), history), f"{slot}: warmup mismatch"
+        # the live candles follow the history, the reader catches up with them only
+        cursor = reader.cursor(*SLOTS[0])
+        owner.append(*SLOTS[0], np.full(ShMemOHLCV.DATA_ITEM_SIZE, -1.))
+        bars, _ = reader.since(*SLOTS[0], cursor)
+        assert np.array_equal(bars, np.full((1, ShMemOHLCV.DATA_ITEM_SIZE), -1.)), "live candle mismatch"
+        reader.cleanup()
+    finally:
+        owner.cleanup()
+    print("warmup: ok")
+
+
+def test_warmup_over_wrapped_ring():
+    """
+    a fresh history written over older candles of the ring (e.g. a segment left by a crashed run) and wrapping it around
+    """
+    owner = ShMemOHLCV(AGENT_ID, SLOTS, DEPTH)
+    try:
+        slot = SLOTS[1]
+        owner.extend(*slot, candles(DEPTH + 20, -1e6))  # stale candles
+        history = candles(DEPTH - 1, 0.)
+        owner.extend(*slot, history)
+        reader = ShMemOHLCV(AGENT_ID)
+        assert np.array_equal(warmup(reader, slot, len(history)), history), "warmup over the wrapped ring mismatch"
+        reader.cleanup()
+    finally:
+        owner.cleanup()
+    print("warmup over a wrapped ring: ok")
+
+
+if __name__ == "__main__":
+    test_warmup()
+    test_warmup_over_wrapped_ring()
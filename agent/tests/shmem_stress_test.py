@@ -0,0 +1,88 @@
+import multiprocessing
+import time
+import numpy as np
+
+from connectors.helpers import gen_agent_id
+from agent.shmem import ShMemOHLCV
+
+
+'''
+Seqlock stress test: one writer stores rows of equal values k = 1, 2, 3... into a few slots
+and appends them to the histories of the slots, many reader processes read them concurrently and check
+that every copy is consistent (all values equal), that k never goes back,
+and that the candles caught up from the history are consecutive.
+Run: python -m agent.tests.shmem_stress_test
+'''
+
+AGENT_ID = gen_agent_id("Stress_Test_Agent")
+SLOTS = [(1, 11), (5, 11), (15, 22)]  # (timeframe, asset id)
+DEPTH = 64
+
+
+def writer(seconds: float, stored: multiprocessing.Value):
+    shmem = ShMemOHLCV(AGENT_ID)
+    k = 0
+    end = time.time() + seconds
+    while time.time() < end:
+        k += 1
+        for tf, aid in SLOTS:
+            shmem.store(tf, aid, np.full(ShMemOHLCV.DATA_ITEM_SIZE, float(k)))
+            shmem.append(tf, aid, np.full(ShMemOHLCV.DATA_ITEM_SIZE, float(k)))
+    stored.value = k
+    shmem.cleanup()
+
+
+def reader(seconds: float, errors: multiprocessing.Value, reads: multiprocessing.Value):
+    shmem = ShMemOHLCV(AGENT_ID)
+    last = {slot: 0. for slot in SLOTS}
+    cursors = {slot: shmem.cursor(*slot) for slot in SLOTS}
+    out = np.empty(ShMemOHLCV.DATA_ITEM_SIZE)
+    n = 0
+    end = time.time() + seconds
+    while time.time() < end:
+        for slot in SLOTS:
+            v = shmem.read(*slot, out=out)
+            if not np.all(v == v[0]) or v[0] < last[slot]:
+                with errors.get_lock():
+                    errors.value += 1
+            last[slot] = v[0]
+            bars, cursors[slot] = shmem.since(*slot, cursors[slot])
+            if len(bars) and (not np.all(bars == bars[:, :1]) or bars[-1, 0] != cursors[slot] or np.any(np.diff(bars[:, 0]) != 1.)):
+                with errors.get_lock():
+                    errors.value += 1
+            n += 1
+    with reads.get_lock():
+        reads.value += n
+    shmem.cleanup()
+
+
+def stress(readers: int = 8, seconds: float = 2.) -> (int, int, int):
+    """
+    returns (stored rows, reads, inconsistent reads)
+    """
+    owner = ShMemOHLCV(AGENT_ID, SLOTS, DEPTH)
+    errors = multiprocessing.Value('q', 0)
+    reads = multiprocessing.Value('q', 0)
+    stored = multiprocessing.Value('q', 0)
+    try:
+        processes = [multiprocessing.Process(target=reader, args=(seconds, errors, reads)) for _ in range(readers)]
+        processes.append(multiprocessing.Process(target=writer, args=(seconds, stored)))
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+    finally:
+        owner.cleanup()
+    return stored.value, reads.value, errors.value
+
+
+def test_seqlock_stress():
+    stored, reads, errors = stress(readers=4, seconds=1.)
+    assert stored > 0 and reads > 0
+    assert errors == 0, f"{errors} inconsistent reads of {reads}"
+
+
+if __name__ == "__main__":
+    stored, reads, errors = stress()
+    print(f"stored: {stored}, reads: {reads}, inconsistent reads: {errors}")
+    assert errors == 0
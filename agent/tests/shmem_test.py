@@ -12,7 +12,7 @@ SOLUSDT_ID = gen_asset_id(Provider.BYBIT, MarketType.FUTURE, "SOLUSDT")
 BTCUSDT_ID = gen_asset_id(Provider.BYBIT, MarketType.SPOT, "BTCUSDT")
 
 if __name__ == "__main__":
-    hash_table = ShMemOHLCV(AGENT_ID, 3)
+    hash_table = ShMemOHLCV(AGENT_ID, [(5, SOLUSDT_ID), (15, BTCUSDT_ID), (60, BTCUSDT_ID)])
     print("Storing data...")
     hash_table.store(5, SOLUSDT_ID, np.array([1.23, 4.56, 7.89, 0.12, 3.45]))
     hash_table.store(15, BTCUSDT_ID, np.array([2.34, 5.67, 8.90, 1.23, 4.56]))
@@ -33,7 +33,7 @@ if __name__ == "__main__":
 
 # Writer process
 def writer():
-    shmem = ShMemOHLCV(AGENT_ID, 3)
+    shmem = ShMemOHLCV(AGENT_ID, [(5, 1), (15, 2), (60, 2)])
     print("[Writer] Storing data...")
     shmem.store(5, 1, np.array([1.23, 4.56, 7.89, 0.12, 3.45]))
     shmem.store(15, 2, np.array([2.34, 5.67, 8.90, 1.23, 4.56]))
@@ -46,7 +46,7 @@ def writer():
 # Reader process
 def reader(timeframe):
     shmem = ShMemOHLCV(AGENT_ID)
-    result = shmem.read(timeframe, SOLUSDT_ID)
+    result = shmem.read(timeframe, 1)
     print(f"[Reader {multiprocessing.current_process().name}] Read {timeframe}: {result}")
 
 if __name__ == "__main__":
@@ -91,11 +91,11 @@ shared_mem.unlink()
 # Benchmarking ShMemOHLCV Attach Time
 #------------------------------------
 
-shared_mem = ShMemOHLCV(1, 1)
+shared_mem = ShMemOHLCV(1, [(1, 1)])
 
 start = time.perf_counter()
 for _ in range(1000):  # Attach 1000 times
-    sm = ShMemOHLCV(1, 1)
+    sm = ShMemOHLCV(1, [(1, 1)])
     sm.cleanup()
 end = time.perf_counter()
 
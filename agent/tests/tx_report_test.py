@@ -0,0 +1,134 @@
+import asyncio
+from collections import OrderedDict
+from decimal import Decimal
+from types import SimpleNamespace
+
+from connectors.enums import ConnMode, MarketType, Provider
+from connectors.bybit.feeding_acc import FeedingAccount
+from agent.agent_base import QMsgType
+from agent.agent_service import AgentService
+from agent.money_guard import MoneyGuard
+from agent.tx_log import TxLog
+
+
+'''
+Handling of the order updates by AgentService.tx_rpt_handler: the updates carry cumulative executed values,
+so every fill of a partially filled order must be accounted once, whatever source (the feeds or the polling) delivers it.
+The executions of the execution stream are turned into the cumulative order states by FeedingAccount.
+Run: python -m agent.tests.tx_report_test
+'''
+
+
+class Agent:
+    def __init__(self, market: MarketType, asset: str):
+        self.common_params = SimpleNamespace(provider=Provider.BYBIT, market=market, asset=asset)
+        self.txs = []  # the txs sent to the strategy
+
+    async def push_data(self, data, wait_ack = True):
+        msg_type, tx = data
+        assert msg_type == QMsgType.QMSG_TX
+        self.txs.append(tx)
+
+
+def order_update(status: str, qty: str, value: str, fee: str, ts_ms: int, order_id: str = "1") -> dict:
+    """
+    order stream item of a spot buy order
+    """
+    return {"orderId": order_id, "orderStatus": status, "cancelType": "", "rejectReason": "", "category": "spot", "symbol": "SOLUSDT", "side": "Buy",
+            "cumExecQty": qty, "cumExecValue": value, "avgPrice": str(Decimal(value) / Decimal(qty)), "cumExecFee": fee,
+            "stopOrderType": "", "updatedTime": str(ts_ms)}
+
+
+def execution(exec_id: str, qty: str, value: str, fee: str, leaves: str, ts_ms: int, order_id: str = "1") -> dict:
+    """
+    execution stream item of a spot buy order
+    """
+    return {"orderId": order_id, "execId": exec_id, "category": "spot", "symbol": "SOLUSDT", "side": "Buy", "execQty": qty, "execValue": value,
+            "execPrice": str(Decimal(value) / Decimal(qty)), "execFee": fee, "leavesQty": leaves, "stopOrderType": "", "execTime": str(ts_ms)}
+
+
+def service() -> AgentService:
+    svc = object.__new__(AgentService)  # without the provider connections and the TG-bot socket
+    svc.agent = Agent(MarketType.SPOT, "SOLUSDT")
+    svc.equity_base = Decimal(1000)
+    svc.equity = Decimal(0)
+    svc.tx_log = TxLog(":memory:")
+    svc.money_guard = MoneyGuard({"max_drawdown_limit": 1., "loss_series_len_limit": 100, "limits_period_h": 24}, svc.tx_log)
+    svc.tx_orders = OrderedDict()
+    svc.notices = []
+
+    async def notify_on_tx(tx, pnl, msg):
+        svc.notices.append(msg)
+
+    async def notify_on_trade_disallowance():
+        pass
+
+    svc._tg_notify_on_tx = notify_on_tx
+    svc._tg_notify_on_trade_disallowance = notify_on_trade_disallowance
+    return svc
+
+
+async def handle(svc: AgentService, *items):
+    q = asyncio.Queue()
+    task = asyncio.create_task(svc.tx_rpt_handler(q))
+    for item in items:
+        q.put_nowait(item)
+        await asyncio.sleep(.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def test_partial_fills():
+    svc = service()
+    partial = FeedingAccount._order_tx(order_update("PartiallyFilled", "4", "400", "0.4", 1000))
+    filled = FeedingAccount._order_tx(order_update("Filled", "10", "1030", "1.03", 2000))
+    asyncio.run(handle(svc,
+                       [partial],  # the feed
+                       [partial, filled],  # the feed after a reconnect repeats an update
+                       filled,  # the polling delivers the final state again
+                       partial))  # and a stale one
+    rows = svc.tx_log.conn.execute("SELECT value, price, fee FROM trades ORDER BY timestamp").fetchall()
+    assert rows == [(4., 100., .4), (6., 105., .63)], f"tx log mismatch: {rows}"
+    assert [tx.value for tx in svc.agent.txs] == [4, 6], "the strategy got wrong fills"
+    # the same fills as two separate filled orders
+    ref = service()
+    asyncio.run(handle(ref, FeedingAccount._order_tx(order_update("Filled", "4", "400", "0.4", 1000, "2")),
+                       FeedingAccount._order_tx(order_update("Filled", "6", "630", "0.63", 2000, "3"))))
+    assert (svc.equity, svc.equity_base) == (ref.equity, ref.equity_base) == (Decimal(1030), Decimal("368.97")), \
+        f"equity mismatch: {svc.equity}, {svc.equity_base}"
+    assert len(svc.notices) == 2
+    print("partial fills: ok")
+
+
+def test_cancelled_after_partial_fill():
+    svc = service()
+    partial = FeedingAccount._order_tx(order_update("PartiallyFilled", "4", "400", "0.4", 1000))
+    cancelled = FeedingAccount._order_tx(order_update("Cancelled", "4", "400", "0.4", 2000))
+    asyncio.run(handle(svc, [partial], [cancelled], cancelled))
+    rows = svc.tx_log.conn.execute("SELECT value FROM trades").fetchall()
+    assert rows == [(4.,)], f"tx log mismatch: {rows}"
+    assert svc.equity == Decimal(400), f"equity mismatch: {svc.equity}"
+    assert svc.notices[-1].startswith("tx cancelled") and len(svc.notices) == 2, svc.notices
+    print("cancelled after a partial fill: ok")
+
+
+def test_equal_partial_executions():
+    svc = service()
+    fa = FeedingAccount(None, "", "", ConnMode.NORMAL)
+    first = fa._exec_order_tx(execution("a", "4", "400", "0.4", "6", 1000))
+    second = fa._exec_order_tx(execution("b", "4", "420", "0.42", "2", 2000))  # the same size as the first one
+    assert fa._exec_order_tx(execution("b", "4", "420", "0.42", "2", 2000)) is None, "a repeated execution is not dropped"
+    asyncio.run(handle(svc,
+                       [first], [second],  # the execution stream
+                       FeedingAccount._order_tx(order_update("PartiallyFilled", "8", "820", "0.82", 2000)),  # the order stream repeats them
+                       [fa._exec_order_tx(execution("c", "2", "200", "0.2", "0", 3000))]))  # the last execution fills the order
+    rows = svc.tx_log.conn.execute("SELECT value, price, fee FROM trades ORDER BY timestamp").fetchall()
+    assert rows == [(4., 100., .4), (4., 105., .42), (2., 100., .2)], f"tx log mismatch: {rows}"
+    assert [tx.value for tx in svc.agent.txs] == [4, 4, 2], "the strategy got wrong fills"
+    print("equal partial executions: ok")
+
+
+if __name__ == "__main__":
+    test_partial_fills()
+    test_cancelled_after_partial_fill()
+    test_equal_partial_executions()
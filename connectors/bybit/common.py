@@ -1,3 +1,8 @@
+import asyncio
+import time
+
+import aiohttp
+
 from connectors.enums import ConnMode, MarketType
 
 LOG_PREFIX = "ByBit API Error:"
@@ -21,3 +26,128 @@ def _str2market_type(market: str) -> MarketType:
         return MarketTypes[market]
     except KeyError:
         raise TypeError(f"Unknown market type '{market}'")
+
+
+class HttpSession:
+    """
+    Long-lived aiohttp session of a connector with a keep-alive connection pool and a DNS cache,
+    so the requests reuse the open TLS connections instead of a handshake per request.
+    The session is created lazily in the running event loop and re-created if the connector is used from another loop,
+    close() must be awaited in the loop before the loop ends.
+    """
+    def __init__(self, limit_per_host: int = 8, keepalive_timeout: float = 60., dns_ttl: int = 300):
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.session: aiohttp.ClientSession | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    def get(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self.loop is not loop:
+            connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host, keepalive_timeout=self.keepalive_timeout,
+                                             ttl_dns_cache=self.dns_ttl)
+            self.session = aiohttp.ClientSession(connector=connector)
+            self.loop = loop
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed and self.loop is asyncio.get_running_loop():
+            await self.session.close()
+        self.session = self.loop = None
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.ts = time.monotonic()
+        self.blocked_until = 0.  # monotonic time of the limit reset reported by the exchange
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+    # seconds until the bucket has the tokens
+    def delay(self, now: float, tokens: float = 1.) -> float:
+        return max(self.blocked_until - now, (tokens - self.tokens) / self.rate, 0.)
+
+
+class RateLimiter:
+    """
+    Client-side token-bucket scheduler of the REST requests, shared by the connectors of an API key (see shared()).
+    • every endpoint group has a bucket per category (spot, linear...), as the exchange counts the limits,
+      its rate and budget are updated from the X-Bapi-Limit* response headers of the requests of the group and the category,
+      the public market endpoints are limited by the IP budget only
+    • all requests of the process also share the bucket of the IP limit
+    • order placement, amendment and cancellation (PRIORITY_ENDPOINTS) go first: the other requests wait
+      while they are waiting and leave a reserve of the IP budget for them
+    """
+    IP_RATE = 100.  # requests per second, ByBit allows 600 per 5 seconds per IP
+    ENDPOINT_RATE = 10.  # requests per second of a private endpoint until the exchange reports its limit
+    RESERVE = .2  # share of the IP budget reserved for the priority requests
+    PRIORITY_ENDPOINTS = {"/v5/order/create", "/v5/order/amend", "/v5/order/cancel", "/v5/order/cancel-all",
+                          "/v5/order/create-batch", "/v5/order/amend-batch", "/v5/order/cancel-batch",
+                          "/v5/position/trading-stop"}
+    # endpoints counted in the budget of another endpoint, the other endpoints are groups of their own
+    GROUPS = {"/v5/order/create-batch": "/v5/order/create", "/v5/order/amend-batch": "/v5/order/amend",
+              "/v5/order/cancel-batch": "/v5/order/cancel"}
+
+    _shared: dict[str, 'RateLimiter'] = {}
+
+    @classmethod
+    def shared(cls, api_key: str) -> 'RateLimiter':
+        if api_key not in cls._shared:
+            cls._shared[api_key] = cls()
+        return cls._shared[api_key]
+
+    def __init__(self):
+        self.ip = TokenBucket(self.IP_RATE, self.IP_RATE)
+        self.buckets: dict[tuple[str, str], TokenBucket] = {}  # (group, category) -> bucket
+        self.priority_waiting = 0
+
+    def _bucket(self, endpoint: str, category: str) -> TokenBucket:
+        key = (self.GROUPS.get(endpoint, endpoint), category)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            rate = self.IP_RATE if endpoint.startswith("/v5/market/") else self.ENDPOINT_RATE
+            bucket = self.buckets[key] = TokenBucket(rate, rate)
+        return bucket
+
+    async def acquire(self, endpoint: str, category: str = ""):
+        priority = endpoint in self.PRIORITY_ENDPOINTS
+        bucket = self._bucket(endpoint, category)
+        reserve = 0. if priority else self.ip.capacity * self.RESERVE
+        if priority:
+            self.priority_waiting += 1
+        try:
+            while True:
+                now = time.monotonic()
+                self.ip.refill(now)
+                bucket.refill(now)
+                if priority or self.priority_waiting == 0:
+                    wait = max(self.ip.delay(now, 1. + reserve), bucket.delay(now))
+                    if wait == 0.:
+                        self.ip.tokens -= 1.
+                        bucket.tokens -= 1.
+                        return
+                else:
+                    wait = 1. / self.ip.rate  # let the priority requests go first
+                await asyncio.sleep(wait)
+        finally:
+            if priority:
+                self.priority_waiting -= 1
+
+    # updates the budget of the endpoint group in the category from the response headers
+    def update(self, endpoint: str, headers, category: str = ""):
+        bucket = self._bucket(endpoint, category)
+        limit = headers.get("X-Bapi-Limit")
+        if limit:
+            bucket.rate = bucket.capacity = float(limit)  # the limit is per second
+        status = headers.get("X-Bapi-Limit-Status")
+        if status:
+            bucket.tokens = min(bucket.tokens, float(status))
+            reset = headers.get("X-Bapi-Limit-Reset-Timestamp")
+            if float(status) <= 0. and reset:
+                bucket.blocked_until = time.monotonic() + max(int(reset) / 1000 - time.time(), 0.)
@@ -17,24 +17,34 @@ from connectors.bybit.common import _market_type2str, LOG_PREFIX, ConnMode
 # https://bybit-exchange.github.io/docs/v5/ws/connect
 
 class FeedingMarket:
+    """
+    Kline streams of many symbols and intervals: the topics share a WebSocket connection,
+    the connections are added by TOPICS_PER_CONN topics, each one runs in its own thread with a stall watchdog.
+    The closed candles are routed to the queues of their streams (subscribe), the kline data gets the "symbol" key.
+    """
+    TOPICS_PER_CONN = 500  # ByBit limits the args of a public connection to 21000 characters
+    ARGS_PER_REQUEST = 10  # ByBit spot allows up to 10 args per subscription request
+
     def __init__(self, asset_type: MarketType, out_queue: asyncio.Queue, mode: ConnMode):
         self.asset_type = asset_type
-        self.out_queue = out_queue
+        self.out_queue = out_queue  # default queue of the streams
         self.mode = mode
 
-        self.ws: WebSocket | None = None
+        self.routes: dict[str, asyncio.Queue] = {}  # topic to the queue of the stream
+        self.wss: list[WebSocket | None] = []
         self._stop_event = th.Event()
         self.loop = None
-        self.feed_thread: th.Thread | None = None
-        self.last_msg_time = time.time()
+        self.feed_threads: list[th.Thread] = []
+        self.last_msg_time: list[float] = []  # per connection
         self.lock = th.Lock()
 
     def cleanup(self):
         self._stop_event.set()
-        if self.ws:
-            self.ws.exit()
-        if self.feed_thread:
-            self.feed_thread.join(timeout=1)
+        for ws in self.wss:
+            if ws:
+                ws.exit()
+        for thread in self.feed_threads:
+            thread.join(timeout=1)
 
     @staticmethod
     def validate_timeframe(timeframe_min: int):
@@ -43,48 +53,72 @@ class FeedingMarket:
 
     # https://bybit-exchange.github.io/docs/v5/websocket/public/kline
 
-    def msg_handler(self, msg):
+    def msg_handler(self, conn: int, msg):
         with self.lock:
-            self.last_msg_time = time.time()
-        data = msg["data"][0]
-        if int(data["timestamp"]) >= int(data["end"]):  # do not send incomplete candles
-            asyncio.run_coroutine_threadsafe(self.out_queue.put(data), self.loop)
+            self.last_msg_time[conn] = time.time()
+        queue = self.routes[msg["topic"]]
+        symbol = msg["topic"].rsplit(".", 1)[1]
+        for data in msg["data"]:
+            if int(data["timestamp"]) >= int(data["end"]):  # do not send incomplete candles
+                data["symbol"] = symbol
+                self.loop.call_soon_threadsafe(queue.put_nowait, data)
 
     # interval (min) = 1 3 5 15 30 60 120 240 360 720, 1440 (day), 10080 (week), 40320 (month)
-    def start_feed(self, asset: str, timeframe_min: int):
-        log = mplog.get_logger("ByBit feed (prices)")
+    # adds a stream to feed into the queue (the default one if not set), to call before start
+    def subscribe(self, asset: str, timeframe_min: int, queue: asyncio.Queue | None = None):
+        FeedingMarket.validate_timeframe(timeframe_min)
+        self.routes[f"kline.{timeframe_min}.{asset}"] = queue or self.out_queue
 
-        def start_feed_impl(asset: str, timeframe_min: int):
-            FeedingMarket.validate_timeframe(timeframe_min)
+    def start(self):
+        log = mplog.get_logger("ByBit feed (prices)")
 
+        def start_feed_impl(conn: int, topics: list[str]):
             while not self._stop_event.is_set():
                 try:
                     # ByBit Demo WebSockets only supports the private streams, so for demo mode regular mainnet used (demo=False always)
                     # callback_function ws_name tld domain rsa_authentication ping_interval ping_timeout trace_logging private_auth_expire
-                    self.ws = WebSocket(channel_type=_market_type2str(self.asset_type), testnet=self.mode == ConnMode.TESTNET, restart_on_error=False, retries=0)
+                    self.wss[conn] = ws = WebSocket(channel_type=_market_type2str(self.asset_type), testnet=self.mode == ConnMode.TESTNET, restart_on_error=False, retries=0)
 
-                    # with self.lock:
-                    self.last_msg_time = time.time()
+                    with self.lock:
+                        self.last_msg_time[conn] = time.time()
 
-                    self.ws.kline_stream(interval=timeframe_min, symbol=asset, callback=self.msg_handler)
+                    # the symbols of an interval are subscribed by one request per ARGS_PER_REQUEST topics
+                    by_interval = {}
+                    for topic in topics:
+                        _, interval, symbol = topic.split(".")
+                        by_interval.setdefault(int(interval), []).append(symbol)
+                    for interval, symbols in by_interval.items():
+                        for i in range(0, len(symbols), self.ARGS_PER_REQUEST):
+                            ws.kline_stream(interval=interval, symbol=symbols[i:i + self.ARGS_PER_REQUEST], callback=lambda msg: self.msg_handler(conn, msg))
 
                     # watchdog loop - check for stall every second
                     while not self._stop_event.is_set():
                         time.sleep(1)
                         with self.lock:
-                            delta = time.time() - self.last_msg_time
+                            delta = time.time() - self.last_msg_time[conn]
                         if delta > 15:  #todo: move to settings?
-                            log.warning(f"WebSocket feed stalled for {delta:.1f}s, restarting...")
+                            log.warning(f"WebSocket feed {conn} stalled for {delta:.1f}s, restarting...")
                             break
                 except Exception as e:
                     log.critical(e, exc_info=True)
-                    if self.ws:
-                        self.ws.exit()
+                if self.wss[conn]:
+                    self.wss[conn].exit()
+                if not self._stop_event.is_set():
                     time.sleep(3)  # optional backoff
 
         self.loop = asyncio.get_running_loop()
-        self.feed_thread = th.Thread(target=start_feed_impl, args=(asset, timeframe_min))
-        self.feed_thread.start()
+        topics = list(self.routes)
+        for conn, i in enumerate(range(0, len(topics), self.TOPICS_PER_CONN)):
+            self.wss.append(None)
+            self.last_msg_time.append(time.time())
+            thread = th.Thread(target=start_feed_impl, args=(conn, topics[i:i + self.TOPICS_PER_CONN]))
+            self.feed_threads.append(thread)
+            thread.start()
+
+    # feeds a single stream into the default queue
+    def start_feed(self, asset: str, timeframe_min: int):
+        self.subscribe(asset, timeframe_min)
+        self.start()
 
     # others:
     # https://bybit-exchange.github.io/docs/v5/websocket/public/orderbook
@@ -7,6 +7,7 @@ import time
 
 import threading as th
 import asyncio
+from collections import OrderedDict
 
 import hmac
 
@@ -33,6 +34,7 @@ class FeedingAccount:
         self.feed_ord_thread: th.Thread | None = None
         self.feed_pos_loop = None
         self.feed_pos_thread: th.Thread | None = None
+        self.exec_orders = OrderedDict()  # (cumulative Tx, execution ids) of the recent orders by order id, see _exec_order_tx
 
     def cleanup(self):
         self._stop_event.set()
@@ -43,10 +45,39 @@ class FeedingAccount:
         if self.feed_pos_thread:
             self.feed_pos_thread.join(timeout=1)
 
+    # all executions of a message (partial fills, TP/SL cascades) are pushed to the queue as one list of Tx,
+    # each one as the cumulative state of its order after the execution, as the order stream reports it
     def msg_handler_tx(self, msg):
-        #todo: there may be multiple executions for one order in a single message.
-        data = msg["data"][0]
+        txs = [tx for tx in map(self._exec_order_tx, msg["data"]) if tx is not None]
+        if txs:
+            self.feed_tx_loop.call_soon_threadsafe(self.out_queue.put_nowait, txs)
+
+    def _exec_order_tx(self, data: dict) -> Tx | None:
+        """
+        the execution added to the executed values of its order: the consumers handle the cumulative order updates
+        and account only the increments, so the executions of the order stream, the polling and this stream match.
+        None for an execution repeated after a reconnect.
+        """
+        tx = self._exec_tx(data)
+        last, exec_ids = self.exec_orders.get(tx.order_id, (None, set()))
+        if data["execId"] in exec_ids:
+            return None
+        exec_ids.add(data["execId"])
+        if last is not None:
+            value, value_base, fee = last.value + tx.value, last.value_base + tx.value_base, last.fee + tx.fee
+        else:
+            value, value_base, fee = tx.value, tx.value_base, tx.fee
+        status = TxStatus.FILLED if _s2dec(data["leavesQty"]) == 0 else TxStatus.PARTIALLY_FILLED
+        price = value_base / value if value else tx.price  # the average price of the order
+        order = Tx(tx.order_id, tx.market, tx.ticker, tx.op_side, tx.op_type, value, value_base, price, fee, tx.ts_ms, status, "")
+        self.exec_orders[tx.order_id] = (order, exec_ids)
+        self.exec_orders.move_to_end(tx.order_id)
+        if len(self.exec_orders) > 1000:
+            self.exec_orders.popitem(last=False)
+        return order
 
+    @staticmethod
+    def _exec_tx(data: dict) -> Tx:
         order_id = data["orderId"]
         size = _s2dec(data["execQty"])  # orderQty, leavesQty
         side = 1 if data["side"] == "Buy" else -1  #todo: rm?
@@ -79,8 +110,7 @@ class FeedingAccount:
         #     CreateByClosing | CreateByFGridBot | CloseByFGridBot | CreateByTWAP | CreateByTVSignal | CreateByMartingaleBot/CloseByMartingaleBot | CreateByIceBerg | CreateByArbitrage | CreateByDdh | CreateByMmRateClose - external apps
 
         # orderLinkId, execId, blockTradeId, seq, isLeverage, isMaker, closedSize, tradeIv, markIv, underlyingPrice, marketUnit
-        trade = Tx(order_id, _str2market_type(data["category"]), data["symbol"], op_side, op_type, side * size, side * value, price, fee, exec_ts_ms, TxStatus.FILLED, "")
-        self.feed_tx_loop.call_soon_threadsafe(self.out_queue.put_nowait, trade)
+        return Tx(order_id, _str2market_type(data["category"]), data["symbol"], op_side, op_type, side * size, side * value, price, fee, exec_ts_ms, TxStatus.FILLED, "")
 
     def start_feed_tx(self):
         def start_feed_tx_impl():
@@ -113,9 +143,14 @@ class FeedingAccount:
         self.feed_tx_thread = th.Thread(target=start_feed_tx_impl)
         self.feed_tx_thread.start()
 
+    # the execution updates of all orders of a message are pushed to the queue as one list of Tx
     def msg_handler_ord(self, msg):
-        data = msg["data"][0]
+        txs = [tx for tx in map(self._order_tx, msg["data"]) if tx is not None]
+        if txs:
+            self.feed_ord_loop.call_soon_threadsafe(self.out_queue.put_nowait, txs)
 
+    @staticmethod
+    def _order_tx(data: dict) -> Tx | None:
         order_id = data["orderId"]
         status = data["orderStatus"]
         reason = ""
@@ -131,7 +166,7 @@ class FeedingAccount:
             case "PartiallyFilled" | "PartiallyFilledCanceled":  # PFC supported only for spot
                 status = TxStatus.PARTIALLY_FILLED
             case _:  # New | Untriggered | Triggered | Deactivated - non-executions
-                return
+                return None
 
         size = _s2dec(data["cumExecQty"])  # qty, leavesQty, marketUnit(spot)=baseCoin|quoteCoin
         side = 1 if data["side"] == "Buy" else -1  #todo: rm?
@@ -163,8 +198,7 @@ class FeedingAccount:
         # if data["category"] == "option":
         #     orderIv, placeType
 
-        trade = Tx(order_id, _str2market_type(data["category"]), data["symbol"], op_side, op_type, side * size, side * value, price, fee, exec_ts_ms, status, reason)
-        self.feed_ord_loop.call_soon_threadsafe(self.out_queue.put_nowait, trade)
+        return Tx(order_id, _str2market_type(data["category"]), data["symbol"], op_side, op_type, side * size, side * value, price, fee, exec_ts_ms, status, reason)
 
     def start_feed_ord(self):
         def start_feed_ord_impl():
@@ -12,13 +12,12 @@ import asyncio
 import hmac
 import hashlib
 import urllib.parse
-import aiohttp
 import json
 
 from connectors.enums import OpSide, OpType, TxStatus
 from connectors.objects import MarketType, Tx
 from connectors.helpers import _s2dec
-from connectors.bybit.common import _market_type2str, _str2market_type, LOG_PREFIX, ConnMode, BaseUrls
+from connectors.bybit.common import _market_type2str, _str2market_type, LOG_PREFIX, ConnMode, BaseUrls, HttpSession, RateLimiter
 
 
 base_urls = {ConnMode.NORMAL: "https://api.bybit.com", ConnMode.DEMO: "https://api-demo.bybit.com", ConnMode.TESTNET: "https://api-testnet.bybit.com"}
@@ -31,6 +30,18 @@ class TradingOperation:
         self.base_url = BaseUrls[mode]
         self.rcv_wnd = str(rcv_wnd)
         self.log = mplog.get_logger("ByBitTradingOperation")
+        self.http = HttpSession()
+        self.limiter = RateLimiter.shared(api_key)  # shared with the other connectors of the key
+
+    # closes the connection pool, to await before the end of the event loop
+    async def close(self):
+        await self.http.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
 
     # generates HMAC SHA256 signature
     def _generate_signature(self, timestamp: str, params: dict, encode_params: bool) -> str:
@@ -42,6 +53,8 @@ class TradingOperation:
 
     # sends a GET request to ByBit API with authentication
     async def _send_request(self, endpoint: str, params: dict, post: bool = False) -> dict:
+        category = params.get("category", "")  # the limits are counted per category
+        await self.limiter.acquire(endpoint, category)  # waits for the budget before the request is signed
         # UTC timestamp in milliseconds
         # should adhere to the following rule: server_time - recv_window <= timestamp < server_time + 1000
         # server_time stands for Bybit server time, which can be queried via the Server Time endpoint https://bybit-exchange.github.io/docs/v5/market/time
@@ -57,12 +70,13 @@ class TradingOperation:
             "Content-Type": "application/json"
         }
         url = f"{self.base_url}{endpoint}"
-        async with aiohttp.ClientSession() as session:
-            if post:
-                response = await session.post(url, headers=headers, data=json.dumps(params))
-            else:
-                response = await session.get(url, params=params, headers=headers, data={})
-
+        session = self.http.get()
+        if post:
+            request = session.post(url, headers=headers, data=json.dumps(params))
+        else:
+            request = session.get(url, params=params, headers=headers, data={})
+        async with request as response:  # the connection returns to the pool on exit
+            self.limiter.update(endpoint, response.headers, category)
             if response.status != 200:
                 raise Exception(f"{LOG_PREFIX}{response.reason}")
             json_data = await response.json()
@@ -471,17 +485,51 @@ class TradingOperation:
         # 'time': 1739794348815
         return False
 
-    #todo:
-    # https://bybit-exchange.github.io/docs/v5/order/batch-place
-    # https://bybit-exchange.github.io/docs/api-explorer/v5/trade/batch-place
-
-    #todo
-    # https://bybit-exchange.github.io/docs/v5/order/batch-amend
-    # https://bybit-exchange.github.io/docs/api-explorer/v5/trade/batch-amend
+    BATCH_LIMITS = {"spot": 10, "linear": 20, "inverse": 20, "option": 20}  # orders per batch request
 
-    #todo
-    # https://bybit-exchange.github.io/docs/v5/order/batch-cancel
-    # https://bybit-exchange.github.io/docs/api-explorer/v5/trade/batch-cancel
+    # sends the orders in chunks of the batch limit concurrently,
+    # returns (order id, None) or (None, error message) for each order in the given order
+    async def _send_batch(self, endpoint: str, market: MarketType, orders: list[dict]) -> list[tuple[str | None, str | None]]:
+        cat = _market_type2str(market)
+        size = self.BATCH_LIMITS[cat]
+
+        async def send_chunk(chunk: list[dict]) -> list[tuple[str | None, str | None]]:
+            request = [{k: v for k, v in order.items() if k != "category"} for order in chunk]
+            try:
+                data = await self._send_request(endpoint, {"category": cat, "request": request}, True)
+            except Exception as e:  # the whole chunk is rejected
+                return [(None, str(e))] * len(chunk)
+            results = data.get("result", {}).get("list", [])
+            statuses = data.get("retExtInfo", {}).get("list", [])
+            ret = []
+            for result, status in zip(results, statuses):
+                if status.get("code") == 0:
+                    ret.append((result["orderId"], None))
+                else:
+                    ret.append((None, status.get("msg")))
+            ret.extend([(None, "no result")] * (len(chunk) - len(ret)))
+            return ret
+
+        chunks = await asyncio.gather(*(send_chunk(orders[i:i + size]) for i in range(0, len(orders), size)))
+        return [r for chunk in chunks for r in chunk]
+
+    # orders - order params of one market as made by _set_order_main_params and _set_order_tp_params
+    async def place_orders(self, market: MarketType, orders: list[dict]) -> list[tuple[str | None, str | None]]:
+        # https://bybit-exchange.github.io/docs/v5/order/batch-place
+        # https://bybit-exchange.github.io/docs/api-explorer/v5/trade/batch-place
+        return await self._send_batch("/v5/order/create-batch", market, orders)
+
+    # orders - params with symbol, orderId or orderLinkId and the changed values (qty, price, takeProfit, stopLoss...)
+    async def amend_orders(self, market: MarketType, orders: list[dict]) -> list[tuple[str | None, str | None]]:
+        # https://bybit-exchange.github.io/docs/v5/order/batch-amend
+        # https://bybit-exchange.github.io/docs/api-explorer/v5/trade/batch-amend
+        return await self._send_batch("/v5/order/amend-batch", market, orders)
+
+    # orders - params with symbol and orderId or orderLinkId
+    async def cancel_orders(self, market: MarketType, orders: list[dict]) -> list[tuple[str | None, str | None]]:
+        # https://bybit-exchange.github.io/docs/v5/order/batch-cancel
+        # https://bybit-exchange.github.io/docs/api-explorer/v5/trade/batch-cancel
+        return await self._send_batch("/v5/order/cancel-batch", market, orders)
 
     #todo
     # https://bybit-exchange.github.io/docs/v5/order/cancel-all
@@ -4,29 +4,45 @@ ByBit API wrapper for initial agent state setuip: account items & tx history, ma
 IMPORTANT NOTICE: Supported modern UTA 2.0 account type (partial support for Classic and UTA 1.0).
 '''
 
+import asyncio
 import hmac
 import hashlib
 import urllib.parse
 from decimal import Decimal
-import aiohttp
 from datetime import datetime, UTC
 import numpy as np
 
 from connectors.enums import Provider, MarketType
 from connectors.objects import Asset, AssetPosition, FundingPosition, Position
 from connectors.helpers import _s2dec
+from connectors.ohlcv_cache import OHLCVCache
 
-from connectors.bybit.common import _market_type2str, LOG_PREFIX, ConnMode, BaseUrls
+from connectors.bybit.common import _market_type2str, LOG_PREFIX, ConnMode, BaseUrls, HttpSession, RateLimiter
 
 
 class TradingState:
+    KLINE_PAGE = 1000  # maximum rows of a kline request allowed by the API
 
-    def __init__(self, api_key: str, api_secret: str, mode: ConnMode, rcv_wnd: int = 5000):
+    # cache: local store of the closed candles, the price history is fetched from the exchange if it is not set
+    def __init__(self, api_key: str, api_secret: str, mode: ConnMode, rcv_wnd: int = 5000, cache: OHLCVCache | None = None):
         self.api_key = api_key
         self.api_secret = api_secret
         self.conn_mode = mode
         self.base_url = BaseUrls[mode]
         self.rcv_wnd = str(rcv_wnd)
+        self.cache = cache
+        self.http = HttpSession()
+        self.limiter = RateLimiter.shared(api_key)  # shared with the other connectors of the key
+
+    # closes the connection pool, to await before the end of the event loop
+    async def close(self):
+        await self.http.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
 
     # generates HMAC SHA256 signature
     def _generate_signature(self, timestamp: str, params: dict) -> str:
@@ -36,6 +52,8 @@ class TradingState:
 
     # sends a GET request to ByBit API with authentication
     async def _send_request(self, endpoint: str, params: dict) -> dict:
+        category = params.get("category", "")  # the limits are counted per category
+        await self.limiter.acquire(endpoint, category)  # waits for the budget before the request is signed
         # UTC timestamp in milliseconds
         # should adhere to the following rule: server_time - recv_window <= timestamp < server_time + 1000
         # server_time stands for Bybit server time, which can be queried via the Server Time endpoint https://bybit-exchange.github.io/docs/v5/market/time
@@ -51,14 +69,14 @@ class TradingState:
             "Content-Type": "application/json"
         }
         url = f"{self.base_url}{endpoint}"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params, headers=headers, data={}) as response:
-                if response.status != 200:
-                    raise Exception(f"{LOG_PREFIX}{response.reason}")
-                json_data = await response.json()
-                if json_data["retCode"] != 0:
-                    raise Exception(f"{LOG_PREFIX}{json_data['retMsg']}")
-                return json_data
+        async with self.http.get().get(url, params=params, headers=headers, data={}) as response:
+            self.limiter.update(endpoint, response.headers, category)
+            if response.status != 200:
+                raise Exception(f"{LOG_PREFIX}{response.reason}")
+            json_data = await response.json()
+            if json_data["retCode"] != 0:
+                raise Exception(f"{LOG_PREFIX}{json_data['retMsg']}")
+            return json_data
 
     async def get_asset_info(self, market: MarketType, asset: str) -> Asset | None:
         # https://bybit-exchange.github.io/docs/v5/market/instrument
@@ -112,17 +130,46 @@ class TradingState:
 
     # params:
     #     timeframe_min ∈ [1,3,5,15,30,60,120,240,360,720,D,W,M]
-    #     history_depth ∈ [1, 1000]
+    #     history_depth - count of the last candles (the current one included), any number
+    #     max_concurrency - pages requested at once
+    #
+    # with the cache only the candles after the last stored one are fetched, the fetched closed candles are stored
     #
     # returns:
-    #     list of tuples: (
+    #     numpy.array [N, 7] of float64 sorted by time, unique by time, N <= history_depth: (
     #         timeframe period start timestamp (ms),
-    #         numpy.array (open price, high price, low price, close price,
-    #             volume,   # USDT or USDC contract: unit is base coin (e.g., BTC); Inverse contract: unit is quote coin (e.g., USD)
-    #             turnover  # USDT or USDC contract: unit is quote coin (e.g., USDT); Inverse contract: unit is base coin (e.g., BTC)
-    #         )
+    #         open price, high price, low price, close price,
+    #         volume,   # USDT or USDC contract: unit is base coin (e.g., BTC); Inverse contract: unit is quote coin (e.g., USD)
+    #         turnover  # USDT or USDC contract: unit is quote coin (e.g., USDT); Inverse contract: unit is base coin (e.g., BTC)
     #     )
-    async def get_price_history(self, asset_type: MarketType, asset: str, timeframe_min: int, history_depth: int):  # -> np.ndarray:
+    async def load_price_history(self, asset_type: MarketType, asset: str, timeframe_min: int, history_depth: int, max_concurrency: int = 4) -> np.ndarray:
+        mul = timeframe_min * 60 * 1000
+        now = int(datetime.now(tz=UTC).timestamp() * 1000)
+        if self.cache is None:
+            return await self._fetch_price_history(asset_type, asset, timeframe_min, history_depth, now, max_concurrency)
+
+        first = now - history_depth * mul  # the first needed candle opens after it
+        cached = self.cache.load(Provider.BYBIT, asset_type, asset, timeframe_min)
+        covered = len(cached) != 0 and cached[0, 0] <= first + mul and cached[-1, 0] > first
+        if covered:  # the missing tail starting from the last stored candle
+            cached = cached[np.searchsorted(cached[:, 0], first, side="right"):]
+            depth = (now - int(cached[-1, 0])) // mul + 1
+        else:
+            depth = history_depth
+        fetched = await self._fetch_price_history(asset_type, asset, timeframe_min, depth, now, max_concurrency)
+        closed = fetched[fetched[:, 0] + mul <= now]
+        if covered:
+            self.cache.append(Provider.BYBIT, asset_type, asset, timeframe_min, closed)
+            data = np.concatenate((cached, fetched))
+            _, index = np.unique(data[:, 0], return_index=True)
+            return data[index[-history_depth:]]
+        if len(closed):
+            if len(cached) != 0 and cached[-1, 0] >= closed[0, 0] - mul:  # the stored candles continue with the fetched ones
+                closed = np.concatenate((cached[cached[:, 0] < closed[0, 0]], closed))
+            self.cache.replace(Provider.BYBIT, asset_type, asset, timeframe_min, closed)
+        return fetched
+
+    async def _fetch_price_history(self, asset_type: MarketType, asset: str, timeframe_min: int, history_depth: int, now: int, max_concurrency: int) -> np.ndarray:
         # https://bybit-exchange.github.io/docs/v5/market/kline
         # https://bybit-exchange.github.io/docs/api-explorer/v5/market/kline
 
@@ -130,38 +177,44 @@ class TradingState:
 
         endpoint = "/v5/market/kline"
         cat = _market_type2str(asset_type)
-        params = {"category": cat, "symbol": asset}
         if timeframe_min <= 720:
-            params["interval"] = str(timeframe_min)
+            interval = str(timeframe_min)
         elif timeframe_min == 1440:
-            params["interval"] = "D"
-        elif timeframe_min == 10080:
-            params["interval"] = "W"
+            interval = "D"
+        else:  # 10080
+            interval = "W"
         # "M" - not supported
 
-        limit = history_depth
-        max_limit = 1000  # maximum allowed by the API
-        while limit > 0:
+        # all page windows are planned from a single time point, so they neither drift nor overlap
+        mul = timeframe_min * 60 * 1000
+        first = now - history_depth * mul
+        windows = [(start, min(start + self.KLINE_PAGE * mul - 1, now)) for start in range(first, now, self.KLINE_PAGE * mul)]
 
-            if limit > max_limit:
-                now = int(datetime.now(tz=UTC).timestamp() * 1000)
-                mul = timeframe_min * 60 * 1000
-                start_ts_ms = now - limit * mul
-                params["start"] = start_ts_ms
-                params["end"] = start_ts_ms + 1000 * mul
-            params["limit"] = min(limit, 1000)  # history_depth
+        semaphore = asyncio.Semaphore(max_concurrency)
 
-            data = await self._send_request(endpoint, params)
+        async def fetch_page(start: int, end: int) -> list:
+            params = {"category": cat, "symbol": asset, "interval": interval, "start": start, "end": end, "limit": self.KLINE_PAGE}
+            async with semaphore:
+                data = await self._send_request(endpoint, params)
             data = data.get("result", {})
-            if data["category"] == cat and data["symbol"] == asset:
-                for tohlcvt in data.get("list", []):
-                    # yield np.array([float(x) if x else np.nan for x in tohlcvt], dtype=np.float32)  #todo: ?
-                    yield np.array(tohlcvt, dtype=np.float32)
             # 'retExtInfo': {}
             # 'time': 1739794348815
-
-            limit -= max_limit if limit > max_limit else limit
-
+            if data["category"] == cat and data["symbol"] == asset:
+                return data.get("list", [])
+            return []
+
+        pages = await asyncio.gather(*(fetch_page(start, end) for start, end in windows))
+        rows = [tohlcvt for page in pages for tohlcvt in page]
+        if not rows:
+            return np.empty((0, 7), dtype=np.float64)
+        data = np.array(rows, dtype=np.float64)
+        _, index = np.unique(data[:, 0], return_index=True)  # sorted by time without the duplicates of the page bounds
+        return data[index[-history_depth:]]
+
+    # row by row version of load_price_history, yields None after the last row
+    async def get_price_history(self, asset_type: MarketType, asset: str, timeframe_min: int, history_depth: int):  # -> np.ndarray:
+        for tohlcvt in await self.load_price_history(asset_type, asset, timeframe_min, history_depth):
+            yield tohlcvt
         yield None
 
     async def get_assets(self) -> list[AssetPosition]:
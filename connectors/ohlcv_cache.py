@@ -0,0 +1,76 @@
+'''
+On-disk store of closed candles per (provider, market, ticker, timeframe)
+
+Every stream is an append-only file of float64 rows [ts (ms), open, high, low, close, volume, turnover] sorted by time
+without gaps, read as a memory map: loading is zero-copy, and a restart fetches only the missing tail from the exchange.
+Writes are serialized across processes (agents) by an exclusive lock of a separate file <file>.lock:
+a lock of the data file would not serialize them, replace swaps the data file out,
+and a writer waiting on the lock of the old file would write to the orphaned one
+• append keeps only the rows newer than the last stored one
+• replace rewrites the file atomically, the memory maps of the readers keep the previous version
+'''
+
+import fcntl
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+from connectors.enums import Provider, MarketType
+
+
+class OHLCVCache:
+    ROW_SIZE = 7  # ts, ohlcv, turnover as float64
+    ROW_BYTES = ROW_SIZE * 8
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, provider: Provider, market: MarketType, ticker: str, timeframe: int) -> str:
+        return os.path.join(self.path, f"{provider.name}_{market.name}_{ticker}_{timeframe}.f64")
+
+    @contextmanager
+    def _locked(self, fn: str):
+        with open(f"{fn}.lock", "ab") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # released on close
+            yield
+
+    def load(self, provider: Provider, market: MarketType, ticker: str, timeframe: int) -> np.ndarray:
+        """
+        read-only memory map of the stored rows [N, 7], an empty array if nothing is stored
+        """
+        fn = self._file(provider, market, ticker, timeframe)
+        n = os.path.getsize(fn) // self.ROW_BYTES if os.path.exists(fn) else 0
+        if n == 0:
+            return np.empty((0, self.ROW_SIZE), dtype=np.float64)
+        return np.memmap(fn, dtype=np.float64, mode="r", shape=(n, self.ROW_SIZE))
+
+    def append(self, provider: Provider, market: MarketType, ticker: str, timeframe: int, rows: np.ndarray) -> int:
+        """
+        append the rows (sorted by time) newer than the last stored one, returns the count of the appended rows
+        """
+        fn = self._file(provider, market, ticker, timeframe)
+        with self._locked(fn), open(fn, "ab+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size % self.ROW_BYTES:
+                size -= size % self.ROW_BYTES
+                f.truncate(size)  # drop the partial row of an interrupted write
+            last = -np.inf
+            if size:
+                f.seek(size - self.ROW_BYTES)
+                last = np.frombuffer(f.read(self.ROW_BYTES), dtype=np.float64)[0]
+            rows = rows[rows[:, 0] > last]
+            f.write(np.ascontiguousarray(rows, dtype=np.float64).tobytes())
+            return len(rows)
+
+    def replace(self, provider: Provider, market: MarketType, ticker: str, timeframe: int, rows: np.ndarray):
+        """
+        replace the stored rows with the rows (sorted by time)
+        """
+        fn = self._file(provider, market, ticker, timeframe)
+        with self._locked(fn):
+            tmp = f"{fn}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(np.ascontiguousarray(rows, dtype=np.float64).tobytes())
+            os.replace(tmp, fn)
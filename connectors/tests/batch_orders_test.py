@@ -0,0 +1,77 @@
+import asyncio
+
+from connectors.enums import ConnMode, MarketType
+from connectors.bybit.operation import TradingOperation
+
+
+'''
+TradingOperation batch endpoints with a stubbed exchange: the orders are chunked by the batch limit of the category,
+every retExtInfo entry is mapped to its order in the input order, a rejected request fails its whole chunk only.
+Run: python -m connectors.tests.batch_orders_test
+'''
+
+
+class BatchStub(TradingOperation):
+    """
+    answers the batch requests as the exchange does: result.list and retExtInfo.list in the order of the request,
+    an order with zero qty is rejected, a request with a FAIL symbol is rejected whole,
+    a request with a SHORT symbol gets the result of the first order only
+    """
+    def __init__(self):
+        super().__init__("key", "secret", ConnMode.TESTNET)
+        self.requests = []
+
+    async def _send_request(self, endpoint: str, params: dict, post: bool = False) -> dict:
+        assert post
+        request = params["request"]
+        self.requests.append((endpoint, params["category"], request))
+        await asyncio.sleep(.01 / len(self.requests))  # the later chunks are answered first
+        symbols = {order["symbol"] for order in request}
+        if "FAIL" in symbols:
+            raise Exception("Too many visits!")
+        results = [{"symbol": order["symbol"], "orderId": f"id-{order['orderLinkId']}", "orderLinkId": order["orderLinkId"]}
+                   for order in request]
+        statuses = [{"code": 0, "msg": "OK"} if order.get("qty") != "0" else {"code": 170136, "msg": "Order quantity is too low."}
+                    for order in request]
+        if "SHORT" in symbols:
+            results, statuses = results[:1], statuses[:1]
+        return {"retCode": 0, "result": {"list": results}, "retExtInfo": {"list": statuses}}
+
+
+def orders(n: int, symbol: str = "BTCUSDT", start: int = 0) -> list[dict]:
+    return [{"category": "spot", "symbol": symbol, "orderLinkId": f"o{start + i}", "qty": "1", "side": "Buy", "orderType": "Market"}
+            for i in range(n)]
+
+
+def test_chunks():
+    for market, cat, size in ((MarketType.SPOT, "spot", 10), (MarketType.FUTURE, "linear", 20), (MarketType.FUTUREINV, "inverse", 20)):
+        conn = BatchStub()
+        batch = orders(2 * size + 3)
+        results = asyncio.run(conn.place_orders(market, batch))
+        assert [len(request) for _, _, request in conn.requests] == [size, size, 3], f"{market}: chunks mismatch"
+        assert all(request[:2] == ("/v5/order/create-batch", cat) for request in conn.requests), f"{market}: endpoint mismatch"
+        assert all("category" not in order for _, _, request in conn.requests for order in request), \
+            "the category is sent in the orders"
+        assert results == [(f"id-{order['orderLinkId']}", None) for order in batch], f"{market}: results mismatch"
+    print("chunks: ok")
+
+
+def test_statuses():
+    conn = BatchStub()
+    batch = orders(25)
+    batch[3]["qty"] = "0"
+    batch[10:20] = orders(10, "FAIL", 10)  # the second chunk is rejected whole
+    batch[20:25] = orders(5, "SHORT", 20)
+    results = asyncio.run(conn.cancel_orders(MarketType.SPOT, batch))
+    assert all(endpoint == "/v5/order/cancel-batch" for endpoint, _, _ in conn.requests)
+    assert len(results) == len(batch)
+    assert results[3] == (None, "Order quantity is too low."), "the order rejection is not mapped to its order"
+    assert all(results[i] == ("id-o%d" % i, None) for i in range(10) if i != 3)
+    assert results[10:20] == [(None, "Too many visits!")] * 10, "the rejected request does not fail its chunk"
+    assert results[20] == ("id-o20", None) and results[21:] == [(None, "no result")] * 4, "missing results mismatch"
+    print("statuses: ok")
+
+
+if __name__ == "__main__":
+    test_chunks()
+    test_statuses()
@@ -0,0 +1,120 @@
+import asyncio
+import threading as th
+import time
+from contextlib import contextmanager
+
+from connectors.enums import ConnMode, MarketType
+from connectors.bybit.feeding import FeedingMarket
+import connectors.bybit.feeding as feeding
+
+
+'''
+FeedingMarket with a stubbed WebSocket: the streams are sharded by TOPICS_PER_CONN topics per connection
+and subscribed by ARGS_PER_REQUEST symbols per request, the closed candles of a topic go to the queue of its stream.
+Run: python -m connectors.tests.feeding_market_test
+'''
+
+
+class WebSocketStub:
+    """
+    records the kline subscriptions of a connection, push() plays a message of the exchange
+    """
+    connections: list['WebSocketStub'] = []
+    lock = th.Lock()
+
+    def __init__(self, **kwargs):
+        self.streams: list[tuple[int, list[str], callable]] = []
+        with self.lock:
+            self.connections.append(self)
+
+    def kline_stream(self, interval: int, symbol: list[str], callback):
+        self.streams.append((interval, symbol, callback))
+
+    def push(self, topic: str, closed: bool = True):
+        _, interval, symbol = topic.split(".")
+        callback = next(callback for i, symbols, callback in self.streams if i == int(interval) and symbol in symbols)
+        callback({"topic": topic, "data": [{"start": 0, "end": 100, "timestamp": 100 if closed else 50, "close": "1"}]})
+
+    def topics(self) -> set[str]:
+        return {f"kline.{interval}.{symbol}" for interval, symbols, _ in self.streams for symbol in symbols}
+
+    def exit(self):
+        pass
+
+
+@contextmanager
+def stubbed():
+    websocket = feeding.WebSocket
+    feeding.WebSocket = WebSocketStub
+    try:
+        yield
+    finally:
+        feeding.WebSocket = websocket
+
+
+async def started(feed: FeedingMarket, connections: int, timeout: float = 5.) -> list[WebSocketStub]:
+    """
+    starts the feed and waits for its connections to subscribe
+    """
+    WebSocketStub.connections = []
+    feed.start()
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with WebSocketStub.lock:
+            ready = len(WebSocketStub.connections) == connections and all(ws.streams for ws in WebSocketStub.connections)
+        if ready:
+            await asyncio.sleep(.1)  # the last requests of the subscription
+            return sorted(WebSocketStub.connections, key=lambda ws: feed.wss.index(ws))
+        await asyncio.sleep(.01)
+    raise TimeoutError(f"{len(WebSocketStub.connections)} connections of {connections} started")
+
+
+def test_sharding():
+    async def run():
+        feed = FeedingMarket(MarketType.SPOT, asyncio.Queue(), ConnMode.TESTNET)
+        for i in range(1100):
+            feed.subscribe(f"A{i}USDT", 1)
+        for i in range(103):
+            feed.subscribe(f"A{i}USDT", 5)
+        try:
+            connections = await started(feed, 3)
+        finally:
+            feed.cleanup()
+        topics = list(feed.routes)
+        for conn, ws in enumerate(connections):
+            shard = topics[conn * FeedingMarket.TOPICS_PER_CONN:(conn + 1) * FeedingMarket.TOPICS_PER_CONN]
+            assert ws.topics() == set(shard), f"connection {conn}: topics mismatch"
+            assert all(len(symbols) <= FeedingMarket.ARGS_PER_REQUEST for _, symbols, _ in ws.streams), \
+                f"connection {conn}: a request exceeds {FeedingMarket.ARGS_PER_REQUEST} args"
+        assert sum(len(ws.topics()) for ws in connections) == len(topics) == 1203
+    with stubbed():
+        asyncio.run(run())
+    print("sharding: ok")
+
+
+def test_routing():
+    async def run():
+        default, btc = asyncio.Queue(), asyncio.Queue()
+        feed = FeedingMarket(MarketType.SPOT, default, ConnMode.TESTNET)
+        feed.TOPICS_PER_CONN = 2
+        feed.subscribe("BTCUSDT", 1, btc)
+        feed.subscribe("BTCUSDT", 5, btc)
+        feed.subscribe("ETHUSDT", 1)
+        try:
+            first, second = await started(feed, 2)
+            first.push("kline.5.BTCUSDT")
+            first.push("kline.1.BTCUSDT", closed=False)  # the incomplete candles are not fed
+            second.push("kline.1.ETHUSDT")
+            await asyncio.sleep(.1)
+        finally:
+            feed.cleanup()
+        assert btc.qsize() == 1 and btc.get_nowait()["symbol"] == "BTCUSDT", "BTCUSDT candles mismatch"
+        assert default.qsize() == 1 and default.get_nowait()["symbol"] == "ETHUSDT", "the default queue mismatch"
+    with stubbed():
+        asyncio.run(run())
+    print("routing: ok")
+
+
+if __name__ == "__main__":
+    test_sharding()
+    test_routing()
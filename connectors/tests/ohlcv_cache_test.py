@@ -0,0 +1,67 @@
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from connectors.enums import MarketType, Provider
+from connectors.ohlcv_cache import OHLCVCache
+import connectors.ohlcv_cache as ohlcv_cache
+
+
+'''
+OHLCVCache: append keeps only the new rows, and an append waiting for a replace writes into the new file, not the replaced one.
+Run: python -m connectors.tests.ohlcv_cache_test
+'''
+
+KEY = (Provider.BYBIT, MarketType.SPOT, "BTCUSDT", 5)
+
+
+def rows(ts) -> np.ndarray:
+    ts = np.asarray(ts, dtype=float)
+    return np.column_stack([ts] + [ts + i for i in range(1, OHLCVCache.ROW_SIZE)])
+
+
+def test_append():
+    with tempfile.TemporaryDirectory() as path:
+        cache = OHLCVCache(path)
+        assert cache.load(*KEY).shape == (0, OHLCVCache.ROW_SIZE)
+        assert cache.append(*KEY, rows([1, 2, 3])) == 3
+        assert cache.append(*KEY, rows([2, 3, 4, 5])) == 2, "the stored rows are appended again"
+        with open(cache._file(*KEY), "ab") as f:
+            f.write(b"\0" * 20)  # a partial row of an interrupted write
+        assert cache.append(*KEY, rows([6])) == 1
+        assert np.array_equal(cache.load(*KEY), rows([1, 2, 3, 4, 5, 6])), "stored rows mismatch"
+        cache.replace(*KEY, rows([10, 11]))
+        assert np.array_equal(cache.load(*KEY), rows([10, 11])), "replaced rows mismatch"
+    print("append: ok")
+
+
+def test_append_during_replace():
+    with tempfile.TemporaryDirectory() as path:
+        cache = OHLCVCache(path)
+        cache.append(*KEY, rows([1, 2]))
+        appended = []
+        appender = threading.Thread(target=lambda: appended.append(cache.append(*KEY, rows([4]))))
+        replace = os.replace
+
+        def replace_with_waiting_append(src, dst):
+            appender.start()  # the append of another agent waits for the lock of the replace
+            time.sleep(.2)
+            replace(src, dst)
+
+        ohlcv_cache.os.replace = replace_with_waiting_append
+        try:
+            cache.replace(*KEY, rows([1, 2, 3]))
+        finally:
+            ohlcv_cache.os.replace = replace
+        appender.join()
+        assert appended == [1]
+        assert np.array_equal(cache.load(*KEY), rows([1, 2, 3, 4])), "the appended row is lost"
+    print("append during replace: ok")
+
+
+if __name__ == "__main__":
+    test_append()
+    test_append_during_replace()
@@ -0,0 +1,121 @@
+import asyncio
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from connectors.enums import ConnMode, MarketType, Provider
+from connectors.ohlcv_cache import OHLCVCache
+from connectors.bybit.state import TradingState
+import connectors.bybit.state as state
+
+
+'''
+TradingState.load_price_history with the klines of a stubbed exchange: the page windows tile the history without gaps
+and overlaps, the candles repeated at the page bounds are dropped, the cache is extended with the missing tail only.
+Run: python -m connectors.tests.price_history_test
+'''
+
+TIMEFRAME = 5
+MUL = TIMEFRAME * 60 * 1000
+DEPTH = 170
+NOW = 1_700_000_000_000 // MUL * MUL + MUL // 3  # inside the current candle
+
+
+def market(opens) -> np.ndarray:
+    """
+    the candles [t, o, h, l, c, v, turnover] of the synthetic market opening at the times
+    """
+    opens = np.asarray(opens, dtype=float)
+    return np.column_stack([opens] + [opens / MUL + i for i in range(1, 7)])
+
+
+class KlineStub(TradingState):
+    """
+    serves the klines of the synthetic market instead of the exchange
+    """
+    KLINE_PAGE = 50
+
+    def __init__(self, cache: OHLCVCache | None = None):
+        super().__init__("key", "secret", ConnMode.TESTNET, cache=cache)
+        self.windows = []
+
+    async def _send_request(self, endpoint: str, params: dict) -> dict:
+        assert endpoint == "/v5/market/kline" and params["limit"] == self.KLINE_PAGE
+        start, end = params["start"], params["end"]
+        self.windows.append((start, end))
+        await asyncio.sleep(0.)
+        # the candle of the page start is returned as well, so the adjacent pages repeat it, the newest candle goes first
+        rows = market(range(start // MUL * MUL, end + 1, MUL))[::-1]
+        return {"retCode": 0, "result": {"category": params["category"], "symbol": params["symbol"],
+                                         "list": [[str(x) for x in row] for row in rows]}}
+
+
+@contextmanager
+def at(now: int):
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.fromtimestamp(now / 1000, tz)
+    state.datetime = Clock
+    try:
+        yield
+    finally:
+        state.datetime = datetime
+
+
+def load(conn: TradingState, depth: int = DEPTH) -> np.ndarray:
+    return asyncio.run(conn.load_price_history(MarketType.SPOT, "BTCUSDT", TIMEFRAME, depth))
+
+
+def expected(now: int, depth: int = DEPTH) -> np.ndarray:
+    last = now // MUL * MUL  # the current candle
+    return market(range(last - (depth - 1) * MUL, last + 1, MUL))
+
+
+def test_windows():
+    conn = KlineStub()
+    with at(NOW):
+        data = load(conn)
+    assert np.array_equal(data, expected(NOW)), "history mismatch"
+    windows = sorted(conn.windows)
+    assert len(windows) == -(-DEPTH // KlineStub.KLINE_PAGE)
+    assert windows[0][0] == NOW - DEPTH * MUL and windows[-1][1] == NOW, "the windows do not cover the history"
+    for (_, end), (start, _) in zip(windows, windows[1:]):
+        assert start == end + 1, "the windows overlap or leave a gap"
+    assert all(end - start < KlineStub.KLINE_PAGE * MUL for start, end in windows), "a window exceeds the page"
+    print("windows: ok")
+
+
+def test_cache_tail():
+    with tempfile.TemporaryDirectory() as path:
+        cache = OHLCVCache(path)
+        key = (Provider.BYBIT, MarketType.SPOT, "BTCUSDT", TIMEFRAME)
+        with at(NOW):
+            data = load(KlineStub(cache))
+        assert np.array_equal(cache.load(*key), data[:-1]), "the cache holds other than the closed candles"
+
+        now = NOW + 3 * MUL + MUL // 2
+        conn = KlineStub(cache)
+        with at(now):
+            data = load(conn)
+        assert np.array_equal(data, expected(now)), "history over the cache mismatch"
+        assert len(conn.windows) == 1 and conn.windows[0][0] > NOW - 2 * MUL, \
+            f"the stored candles are fetched again: {conn.windows}"
+        stored = cache.load(*key)
+        assert np.array_equal(stored[-len(data) + 1:], data[:-1]), "the closed tail is not appended to the cache"
+        assert np.all(np.diff(stored[:, 0]) == MUL), "the cache has gaps or repeated candles"
+
+        # a deeper history than stored is fetched whole
+        conn = KlineStub(cache)
+        with at(now):
+            data = load(conn, 2 * DEPTH)
+        assert np.array_equal(data, expected(now, 2 * DEPTH)), "deep history mismatch"
+        assert len(conn.windows) == -(-2 * DEPTH // KlineStub.KLINE_PAGE)
+    print("cache tail: ok")
+
+
+if __name__ == "__main__":
+    test_windows()
+    test_cache_tail()
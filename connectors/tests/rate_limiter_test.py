@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+from connectors.bybit.common import RateLimiter, TokenBucket
+
+
+'''
+TokenBucket and RateLimiter: refill and delay of a bucket, buckets per endpoint group and category,
+budgets from the response headers, the IP budget reserve and the precedence of the priority requests.
+Run: python -m connectors.tests.rate_limiter_test
+'''
+
+SPOT_ORDER = ("/v5/order/create", "spot")
+LINEAR_ORDER = ("/v5/order/create", "linear")
+WALLET = ("/v5/account/wallet-balance", "")
+
+
+def test_token_bucket():
+    bucket = TokenBucket(10., 5.)
+    now = bucket.ts
+    bucket.tokens = 0.
+    assert abs(bucket.delay(now) - .1) < 1e-9, "one token takes 1 / rate"
+    assert abs(bucket.delay(now, 3.) - .3) < 1e-9
+    bucket.refill(now + .2)
+    assert abs(bucket.tokens - 2.) < 1e-9 and bucket.delay(now + .2) == 0.
+    bucket.refill(now + 10.)
+    assert bucket.tokens == bucket.capacity, "the bucket is filled over its capacity"
+    bucket.blocked_until = now + 15.
+    assert bucket.delay(now + 10.) == 5., "a blocked bucket is available before the reset"
+    print("token bucket: ok")
+
+
+def test_buckets():
+    limiter = RateLimiter()
+    assert limiter._bucket(*SPOT_ORDER) is not limiter._bucket(*LINEAR_ORDER), "the categories share a bucket"
+    assert limiter._bucket("/v5/order/create-batch", "spot") is limiter._bucket(*SPOT_ORDER), \
+        "the batch endpoint has a budget of its own"
+    assert limiter._bucket("/v5/order/cancel", "spot") is not limiter._bucket(*SPOT_ORDER)
+    assert limiter._bucket("/v5/market/kline", "spot").rate == RateLimiter.IP_RATE
+    assert limiter._bucket(*WALLET).rate == RateLimiter.ENDPOINT_RATE
+
+    limiter.update(*SPOT_ORDER[:1], {"X-Bapi-Limit": "20", "X-Bapi-Limit-Status": "7"}, SPOT_ORDER[1])
+    spot, linear = limiter._bucket(*SPOT_ORDER), limiter._bucket(*LINEAR_ORDER)
+    assert (spot.rate, spot.capacity, spot.tokens) == (20., 20., 7.), "the budget is not updated from the headers"
+    assert (linear.rate, linear.tokens) == (RateLimiter.ENDPOINT_RATE, RateLimiter.ENDPOINT_RATE), \
+        "the headers of a category update another one"
+
+    reset = int((time.time() + 2.) * 1000)
+    limiter.update(*SPOT_ORDER[:1], {"X-Bapi-Limit-Status": "0", "X-Bapi-Limit-Reset-Timestamp": str(reset)},
+                   SPOT_ORDER[1])
+    assert 1.5 < spot.delay(time.monotonic()) <= 2., "the exhausted budget is not blocked until the reset"
+    assert linear.delay(time.monotonic()) == 0.
+    print("buckets: ok")
+
+
+async def acquired(limiter: RateLimiter, endpoint: str, category: str, timeout: float = .05) -> bool:
+    try:
+        await asyncio.wait_for(limiter.acquire(endpoint, category), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+def test_reserve():
+    async def run():
+        limiter = RateLimiter()
+        reserve = limiter.ip.capacity * RateLimiter.RESERVE
+        limiter.ip.tokens = reserve - 10.  # the other requests took the budget below the reserve, it refills in .11 s
+        assert not await acquired(limiter, *WALLET), "a request takes the reserve of the priority requests"
+        limiter.ip.tokens = reserve - 10.
+        assert await acquired(limiter, *SPOT_ORDER), "a priority request waits for the reserve"
+        limiter.ip.tokens = reserve + 1.
+        assert await acquired(limiter, *WALLET), "a request waits above the reserve"
+    asyncio.run(run())
+    print("reserve: ok")
+
+
+def test_priority_first():
+    async def run():
+        limiter = RateLimiter()
+        limiter._bucket(*SPOT_ORDER).tokens = 0.  # the order waits .1 s for its endpoint budget
+        order = []
+
+        async def request(endpoint: str, category: str):
+            await limiter.acquire(endpoint, category)
+            order.append(endpoint)
+
+        priority = asyncio.create_task(request(*SPOT_ORDER))
+        await asyncio.sleep(0.)
+        other = asyncio.create_task(request(*WALLET))
+        await asyncio.gather(priority, other)
+        assert order == [SPOT_ORDER[0], WALLET[0]], "a request goes before the waiting priority request"
+        assert limiter.priority_waiting == 0
+    asyncio.run(run())
+    print("priority first: ok")
+
+
+if __name__ == "__main__":
+    test_token_bucket()
+    test_buckets()
+    test_reserve()
+    test_priority_first()